@@ -0,0 +1,194 @@
+"""Persistent caches under the user cache directory."""
+
+import json
+import os
+import os.path as osp
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any
+
+APP_NAME = "py-tools"
+
+
+def user_cache_dir() -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or osp.expanduser("~/AppData/Local")
+    elif sys.platform == "darwin":
+        base = osp.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or osp.expanduser("~/.cache")
+    return osp.join(base, APP_NAME)
+
+
+class _Cache:
+    """An SQLite table under the user cache directory.
+
+    Rows carry a `used` timestamp, and least recently used rows beyond
+    `max_entries` are evicted on close. Writes, including the `used` updates
+    of cache hits, are buffered and committed every COMMIT_ROWS rows or
+    COMMIT_INTERVAL seconds, so that no write lock is held between commits
+    and a killed run keeps most of its work. Safe to share between threads."""
+
+    DEFAULT_MAX_ENTRIES = 500_000
+    COMMIT_ROWS = 1000
+    COMMIT_INTERVAL = 2.0  # seconds
+    FILE: str
+    TABLE: str
+    SCHEMA: str
+    # primary key columns, first in the schema
+    KEY: tuple[str, ...]
+
+    def __init__(self, path: str | None = None, max_entries: int | None = None):
+        if path is None:
+            path = osp.join(user_cache_dir(), self.FILE)
+        os.makedirs(osp.dirname(osp.abspath(path)), exist_ok=True)
+
+        self.max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} ({self.SCHEMA})")
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.TABLE}_used ON {self.TABLE}(used)"
+        )
+        self._conn.commit()
+
+        where = " AND ".join(f"{c} = ?" for c in self.KEY)
+        self._select_sql = f"SELECT * FROM {self.TABLE} WHERE {where}"
+        self._touch_sql = f"UPDATE {self.TABLE} SET used = ? WHERE {where}"
+        self._rows: dict[tuple, tuple] = {}
+        self._touched: dict[tuple, int] = {}
+        self._flushed = time.monotonic()
+
+    def _get_row(self, key: tuple) -> tuple | None:
+        """the row of `key`, buffered or committed; call with the lock held"""
+        row = self._rows.get(key)
+        if row is None:
+            row = self._conn.execute(self._select_sql, key).fetchone()
+        return row
+
+    def _put_row(self, row: tuple) -> None:
+        """buffer `row`, whose last column is `used`; call with the lock held"""
+        self._rows[row[: len(self.KEY)]] = row
+        self._maybe_flush()
+
+    def _touch(self, key: tuple) -> None:
+        """mark `key` as used; call with the lock held"""
+        if key not in self._rows:
+            self._touched[key] = time.time_ns()
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        pending = len(self._rows) + len(self._touched)
+        if (
+            pending >= self.COMMIT_ROWS
+            or time.monotonic() - self._flushed >= self.COMMIT_INTERVAL
+        ):
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._rows:
+            n = len(next(iter(self._rows.values())))
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.TABLE} VALUES ({', '.join('?' * n)})",
+                self._rows.values(),
+            )
+        if self._touched:
+            self._conn.executemany(
+                self._touch_sql,
+                ((used, *key) for key, used in self._touched.items()),
+            )
+        self._conn.commit()
+        self._rows.clear()
+        self._touched.clear()
+        self._flushed = time.monotonic()
+
+    def flush(self) -> None:
+        """commit buffered writes now"""
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._conn.execute(
+                f"DELETE FROM {self.TABLE} WHERE rowid NOT IN"
+                f" (SELECT rowid FROM {self.TABLE} ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DigestCache(_Cache):
+    """File digests keyed on (st_dev, st_ino, algorithm).
+
+    An entry is fresh only while st_size and st_mtime_ns are unchanged."""
+
+    FILE = "digests.sqlite3"
+    TABLE = "digests"
+    SCHEMA = (
+        "dev INTEGER, ino INTEGER, alg TEXT,"
+        " size INTEGER, mtime_ns INTEGER, digest TEXT, used INTEGER,"
+        " PRIMARY KEY (dev, ino, alg)"
+    )
+    KEY = ("dev", "ino", "alg")
+
+    def get(self, alg: str, st: os.stat_result) -> str | None:
+        key = (st.st_dev, st.st_ino, alg)
+        with self._lock:
+            row = self._get_row(key)
+            if row is None or row[3:5] != (st.st_size, st.st_mtime_ns):
+                return None
+            self._touch(key)
+            return row[5]
+
+    def put(self, alg: str, st: os.stat_result, digest: str) -> None:
+        row = (
+            st.st_dev,
+            st.st_ino,
+            alg,
+            st.st_size,
+            st.st_mtime_ns,
+            digest,
+            time.time_ns(),
+        )
+        with self._lock:
+            self._put_row(row)
+
+
+class DirCache(_Cache):
+    """Per-directory results, as JSON, keyed on (absolute path, kind).
+
+    An entry is fresh only while the directory's st_mtime_ns is unchanged.
+    `kind` tells apart results computed differently for the same directory."""
+
+    FILE = "dirs.sqlite3"
+    TABLE = "dirs"
+    SCHEMA = (
+        "path TEXT, kind TEXT, mtime_ns INTEGER, value TEXT, used INTEGER,"
+        " PRIMARY KEY (path, kind)"
+    )
+    KEY = ("path", "kind")
+
+    def get(self, kind: str, path: str, st: os.stat_result) -> Any:
+        key = (path, kind)
+        with self._lock:
+            row = self._get_row(key)
+            if row is None or row[2] != st.st_mtime_ns:
+                return None
+            self._touch(key)
+        return json.loads(row[3])
+
+    def put(self, kind: str, path: str, st: os.stat_result, value: Any) -> None:
+        row = (path, kind, st.st_mtime_ns, json.dumps(value), time.time_ns())
+        with self._lock:
+            self._put_row(row)
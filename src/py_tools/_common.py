@@ -1,9 +1,15 @@
 """Common utilities."""
 
+import argparse
 import glob
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from itertools import chain
 from os.path import isdir, isfile
-from typing import Iterable
+from typing import BinaryIO, Callable, Iterable, Iterator, TextIO
 
 
 def human_readable_size(size_of_bytes: int) -> str:
@@ -18,6 +24,22 @@ def human_readable_size(size_of_bytes: int) -> str:
     return f"{size:.2f} CB"
 
 
+def parse_size(text: str) -> int:
+    """parse sizes like 65536, 64K, 1M"""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().removesuffix("B")
+    factor = units.get(text[-1:], 1)
+    if factor != 1:
+        text = text[:-1]
+    try:
+        size = int(text) * factor
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}") from None
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive: {text}")
+    return size
+
+
 def glob_paths(
     patterns: Iterable[str],
     recursive: bool = False,
@@ -34,3 +56,84 @@ def glob_paths(
         paths = filter(isdir, paths)
 
     return paths
+
+
+def read_names(fp: BinaryIO, sep: bytes = b"\n") -> Iterator[str]:
+    """Lazily split the stream `fp` into file names by `sep`.
+
+    Names are yielded as soon as they arrive, which keeps a pipe like
+    `find -print0 | ...` flowing instead of waiting for the whole listing."""
+    read = getattr(fp, "read1", fp.read)
+    tail = b""
+    while True:
+        chunk = read(1 << 16)
+        names = (tail + chunk).split(sep)
+        # keep the incomplete last name until more data or EOF
+        tail = names.pop() if chunk else b""
+        for name in names:
+            if sep == b"\n":
+                name = name.removesuffix(b"\r")
+            if name:
+                yield os.fsdecode(name)
+        if not chunk:
+            return
+
+
+def imap_ordered[T, R](
+    func: Callable[[T], R], items: Iterable[T], jobs: int
+) -> Iterator[R]:
+    """Like `map`, but run `func` on a pool of `jobs` threads.
+
+    Results are yielded in input order, and `items` is consumed lazily:
+    at most `2 * jobs` calls are in flight at any time."""
+    if jobs <= 1:
+        yield from map(func, items)
+        return
+
+    pool = ThreadPoolExecutor(jobs)
+    pending: deque[Future[R]] = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class Progress:
+    """A `\\r` status line, redrawn at most every `interval` seconds.
+
+    Each line ends with the rate of `count` per second and the elapsed time.
+    Nothing is drawn unless `file` is a TTY."""
+
+    def __init__(self, interval: float = 0.1, file: TextIO | None = None):
+        self.file = sys.stdout if file is None else file
+        self.interval = interval
+        self.enabled = self.file.isatty()
+        self.begin = time.perf_counter()
+        self._next = 0.0
+        self._width = 0
+
+    def update(self, count: int, text: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if now < self._next:
+            return
+        self._next = now + self.interval
+        elapsed = now - self.begin
+        rate = count / elapsed if elapsed > 0 else 0
+        line = f"{text}  [{rate:,.0f}/s, {elapsed:.1f}s]"
+        self.file.write(f"\r{line:<{self._width}}")
+        self.file.flush()
+        self._width = len(line)
+
+    def clear(self) -> None:
+        """erase the status line"""
+        if self._width:
+            self.file.write(f"\r{'':<{self._width}}\r")
+            self.file.flush()
+            self._width = 0
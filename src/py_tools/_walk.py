@@ -0,0 +1,258 @@
+"""Directory tree walker based on os.scandir."""
+
+import os
+import os.path as osp
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+# walking is bound by syscall latency, not CPU
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def _glob_regex(pattern: str) -> str:
+    """translate a glob where only `**` crosses "/", as in .gitignore"""
+    out: list[str] = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            # zero or more directories
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and (j := pattern.find("]", i + 2)) > 0:
+            body = pattern[i + 1 : j].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def _union(regexes: list[str]) -> re.Pattern | None:
+    if not regexes:
+        return None
+    return re.compile("|".join(f"(?:{r})" for r in regexes))
+
+
+class Ignore:
+    """Glob patterns in .gitignore syntax, compiled once into a single regex.
+
+    Paths are matched relative to the directory the patterns belong to, with
+    "/" as separator. A pattern with a "/" other than a trailing one is
+    anchored there, otherwise it matches at any depth. A trailing "/" matches
+    directories only. Negations ("!") are not supported and skipped."""
+
+    def __init__(self, patterns: Iterable[str]):
+        anywhere: list[str] = []
+        dirs_only: list[str] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith(("#", "!")):
+                continue
+            only_dir = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+            if "/" in pattern:
+                regex = _glob_regex(pattern.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + _glob_regex(pattern)
+            (dirs_only if only_dir else anywhere).append(regex)
+        self._files = _union(anywhere)
+        self._dirs = _union(anywhere + dirs_only)
+        # which version of which file the patterns come from, if any
+        self.stamp = ""
+
+    @classmethod
+    def read(cls, file: str) -> "Ignore | None":
+        """patterns of `file`, None if it is missing or has none"""
+        try:
+            with open(file, encoding="utf-8", errors="replace") as fp:
+                st = os.fstat(fp.fileno())
+                ignore = cls(fp)
+        except OSError:
+            return None
+        ignore.stamp = f"{file}:{st.st_mtime_ns}:{st.st_size}"
+        return ignore or None
+
+    def __bool__(self) -> bool:
+        return self._dirs is not None
+
+    def match(self, rel: str, is_dir: bool) -> bool:
+        regex = self._dirs if is_dir else self._files
+        return regex is not None and regex.fullmatch(rel) is not None
+
+
+type Rules = tuple[tuple[Ignore, str], ...]  # (patterns, prefix of rel paths)
+
+
+class Prune:
+    """Which entries a walk under `top` skips.
+
+    Entries matching `exclude` relative to `top` are skipped, and with
+    `gitignore`, those ignored by a .gitignore met on the way, as well as
+    .git itself. The rules of a directory are gathered once, when it is
+    listed, and skipped directories are never listed."""
+
+    def __init__(self, top: str, exclude: Iterable[str] = (), gitignore: bool = False):
+        self.top = osp.normpath(top)
+        self.exclude = list(exclude)
+        self.gitignore = gitignore
+        patterns = [*self.exclude, ".git/"] if gitignore else self.exclude
+        ignore = Ignore(patterns)
+        self._top_rules: Rules = ((ignore, ""),) if ignore else ()
+        self._rules: dict[str, Rules] = {}
+
+    def _rules_for(self, path: str) -> Rules:
+        rules = self._rules.get(path)
+        if rules is not None:
+            return rules
+        parent = osp.dirname(path)
+        if parent == path or osp.normpath(path) == self.top:
+            rules = self._top_rules
+        else:
+            # a parent is listed before its children, so this rarely recurses
+            name = osp.basename(path)
+            rules = tuple(
+                (ignore, f"{prefix}{name}/")
+                for ignore, prefix in self._rules_for(parent)
+            )
+        if self.gitignore:
+            ignore = Ignore.read(osp.join(path, ".gitignore"))
+            if ignore is not None:
+                rules += ((ignore, ""),)
+        self._rules[path] = rules
+        return rules
+
+    def stamp(self, path: str) -> str:
+        """identifies the .gitignore files that apply to directory `path`,
+        and their versions"""
+        return "|".join(ignore.stamp for ignore, _ in self._rules_for(path))
+
+    def matcher(self, path: str) -> Callable[[str, bool], bool] | None:
+        """return `match(name, is_dir)` for the entries of directory `path`"""
+        rules = self._rules_for(path)
+        if not rules:
+            return None
+
+        def match(name: str, is_dir: bool) -> bool:
+            return any(ignore.match(prefix + name, is_dir) for ignore, prefix in rules)
+
+        return match
+
+
+@dataclass(slots=True)
+class ScanResult:
+    path: str
+    depth: int
+    dirs: list[os.DirEntry] = field(default_factory=list)
+    files: list[os.DirEntry] = field(default_factory=list)
+    error: OSError | None = None
+    # stat of the directory itself, with `stat`
+    st: os.stat_result | None = None
+    # True if a custom scan took the listing from a previous run
+    reused: bool = False
+
+
+class SubDir(NamedTuple):
+    """stands in for the os.DirEntry of a directory known from a cache"""
+
+    path: str
+    name: str
+
+
+type Scan = Callable[[str, int], ScanResult]
+
+
+def scan_dir(
+    path: str, depth: int = 0, stat: bool = False, prune: Prune | None = None
+) -> ScanResult:
+    """List one directory, splitting entries into dirs and non-dirs.
+
+    Symlinks are never followed. With `stat`, the directory and every file
+    entry are stat'ed here, so that the cached `DirEntry.stat()` is free for
+    the caller. Entries matched by `prune` are left out."""
+    result = ScanResult(path, depth)
+    try:
+        if stat:
+            result.st = os.stat(path, follow_symlinks=False)
+        match = prune.matcher(path) if prune is not None else None
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                if match is not None and match(entry.name, is_dir):
+                    continue
+                if is_dir:
+                    result.dirs.append(entry)
+                    continue
+                if stat:
+                    try:
+                        entry.stat(follow_symlinks=False)
+                    except OSError:
+                        pass
+                result.files.append(entry)
+    except OSError as e:
+        result.error = e
+    return result
+
+
+def walk(
+    top: str,
+    recursive: bool = True,
+    *,
+    jobs: int = 1,
+    stat: bool = False,
+    prune: Prune | None = None,
+    scan: Scan | None = None,
+) -> Iterator[ScanResult]:
+    """Walk the tree under `top`, listing directories on `jobs` threads.
+
+    Every directory is listed once with a single scandir pass, or by `scan`
+    if given. Results come in no particular order, except that `top` is
+    always the first."""
+    if scan is None:
+        scan = partial(scan_dir, stat=stat, prune=prune)
+
+    if jobs <= 1:
+        stack = [(top, 0)]
+        while stack:
+            result = scan(*stack.pop())
+            if recursive:
+                stack.extend((d.path, result.depth + 1) for d in result.dirs)
+            yield result
+        return
+
+    pool = ThreadPoolExecutor(jobs)
+    pending: set[Future[ScanResult]] = {pool.submit(scan, top, 0)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if recursive:
+                    for d in result.dirs:
+                        pending.add(pool.submit(scan, d.path, result.depth + 1))
+                yield result
+    finally:
+        pool.shutdown(cancel_futures=True)
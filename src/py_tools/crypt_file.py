@@ -21,14 +21,23 @@
 """
 
 import base64
+import json
+import os
+import os.path as osp
 import random
 import string
-from hashlib import sha256
-from itertools import cycle, starmap
-from operator import xor
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from functools import lru_cache, partial
+from hashlib import blake2b, sha256
+from itertools import batched, groupby
 from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, TextIO
 
-from ._common import glob_paths
+from ._cache import user_cache_dir
+from ._common import glob_paths, imap_ordered, parse_size
+from ._walk import DEFAULT_JOBS, walk
 
 SEED = "cfk"
 
@@ -39,30 +48,29 @@ AB_D = string.ascii_uppercase + string.ascii_lowercase + string.digits
 class MyBase64:
     def __init__(self, seed: str | None = None):
         self.__altchars = b"-_"
-        chars = AB_D + self.__altchars.decode()
-        my_chars = list(chars)
+        chars = (AB_D + self.__altchars.decode()).encode()
+        my_chars = bytearray(chars)
 
         if seed is None:
             seed = SEED
 
-        old_state = random.getstate()
-        random.seed(sha256(seed.encode()).digest())
-        random.shuffle(my_chars)
-        random.setstate(old_state)
+        # the same shuffle as the global `random` seeded alike, without
+        # touching its state
+        random.Random(sha256(seed.encode()).digest()).shuffle(my_chars)
 
-        self.__trans_table_e = {ord(std): my for std, my in zip(chars, my_chars)}
-        self.__trans_table_d = {ord(my): std for std, my in zip(chars, my_chars)}
+        self.__trans_table_e = bytes.maketrans(chars, my_chars)
+        self.__trans_table_d = bytes.maketrans(my_chars, chars)
 
     def encode(self, data: bytes) -> str:
         return (
             base64.b64encode(data, altchars=self.__altchars)
-            .decode()
-            .rstrip("=")
+            .rstrip(b"=")
             .translate(self.__trans_table_e)
+            .decode()
         )
 
     def decode(self, data: str) -> bytes:
-        x = data.translate(self.__trans_table_d).encode()
+        x = data.encode().translate(self.__trans_table_d)
         # 3个8比特分成4个6比特
         # 去除结尾的=剩余长度一定是 4n 4n-1 4n-2
         # 也就是 4n 4n+3 4n+2
@@ -78,18 +86,61 @@ class MyBase64:
         return base64.b64decode(x, altchars=self.__altchars, validate=True)
 
 
-def _xor_bytes(b: bytes, k: bytes) -> bytes:
-    return bytes(starmap(xor, zip(b, cycle(k))))
+@lru_cache(maxsize=64)
+def get_base64(seed: str | None = None) -> MyBase64:
+    """a shared MyBase64 for `seed`, the most recently used ones are kept"""
+    return MyBase64(seed)
+
+
+def _xor_bytes(b: bytes, k: bytes, offset: int = 0) -> bytes:
+    """XOR `b` with `k` repeated, as one big integer operation
+
+    `offset` is where `b` starts in the stream, to keep the key aligned."""
+    n = len(b)
+    if n == 0 or not k:
+        return b""
+    if i := offset % len(k):
+        k = k[i:] + k[:i]
+    q, r = divmod(n, len(k))
+    stream = k * q + k[:r]
+    x = int.from_bytes(b, "little") ^ int.from_bytes(stream, "little")
+    return x.to_bytes(n, "little")
 
 
 BLOCK_SIZE = 1 << 12  # 4KB
+CHUNK_SIZE = 1 << 20  # 1MB, for heads larger than a block
+
+_local = threading.local()
 
 
-def _replace_file_head(path: Path, key: bytes) -> None:
+def _get_buffer() -> memoryview:
+    """a CHUNK_SIZE buffer reused across files by the calling thread"""
+    view: memoryview | None = getattr(_local, "view", None)
+    if view is None:
+        view = _local.view = memoryview(bytearray(CHUNK_SIZE))
+    return view
+
+
+def _xor_file(fp: BinaryIO, key: bytes, size: int | None = BLOCK_SIZE) -> None:
+    """XOR the first `size` bytes of `fp` in place, or all of them if None.
+
+    Data goes through a fixed buffer, so memory stays the same for any size."""
+    buffer = _get_buffer()
+    offset = 0
+    while size is None or offset < size:
+        view = buffer if size is None else buffer[: size - offset]
+        fp.seek(offset)
+        n = fp.readinto(view)
+        if not n:
+            break
+        fp.seek(offset)
+        fp.write(_xor_bytes(view[:n], key, offset))
+        offset += n
+
+
+def _replace_file_head(path: Path, key: bytes, size: int | None = BLOCK_SIZE) -> None:
     with path.open("rb+") as fp:
-        data = _xor_bytes(fp.read(BLOCK_SIZE), key)
-        fp.seek(0)
-        fp.write(data)
+        _xor_file(fp, key, size)
 
 
 def _random_key() -> bytes:
@@ -120,56 +171,553 @@ def _parse_encrypt_name(name: str, *, b64: MyBase64) -> tuple[str, bytes]:
     return _xor_bytes(n, key).decode(), key
 
 
-def encrypt_file(path: Path, b64: MyBase64) -> Path | None:
+def encrypt_file(
+    path: Path, b64: MyBase64, size: int | None = BLOCK_SIZE
+) -> Path | None:
+    """`size` bytes of the head are XORed, the whole file if None"""
     key = _random_key()
     new_name = _get_encrypt_name(path.name, key, b64=b64)
     new_path = path.with_name(new_name)
-    _replace_file_head(path, key)
+    _replace_file_head(path, key, size)
     path.rename(new_path)
     return new_path
 
 
-def decrypt_file(path: Path, b64: MyBase64) -> Path | None:
+def decrypt_file(
+    path: Path, b64: MyBase64, size: int | None = BLOCK_SIZE
+) -> Path | None:
+    """`size` must be the one the file was encrypted with"""
     new_name, key = _parse_encrypt_name(path.name, b64=b64)
     new_path = path.with_name(new_name)
-    _replace_file_head(path, key)
+    _replace_file_head(path, key, size)
     path.rename(new_path)
     return new_path
 
 
+def _ends(fp: BinaryIO, size: int) -> list[tuple[int, bytes]]:
+    """the first and last blocks of the first `size` bytes, with offsets"""
+    fp.seek(0)
+    ends = [(0, fp.read(min(size, BLOCK_SIZE)))]
+    if size > BLOCK_SIZE:
+        offset = max(BLOCK_SIZE, size - BLOCK_SIZE)
+        fp.seek(offset)
+        ends.append((offset, fp.read(size - offset)))
+    return ends
+
+
+def _ends_digest(ends: list[tuple[int, bytes]], key: bytes = b"") -> str:
+    obj = blake2b(digest_size=16)
+    for offset, data in ends:
+        obj.update(_xor_bytes(data, key, offset) if key else data)
+    return obj.hexdigest()
+
+
+@dataclass
+class Entry:
+    """One file of a batch, as journaled before it is touched.
+
+    The digests of the first and last blocks of the XORed range, before and
+    after, tell which of the two the file holds after a crash."""
+
+    old: str
+    new: str
+    key: str
+    before: str
+    after: str
+    # bytes XORed from the start, 0 for a directory
+    size: int = BLOCK_SIZE
+    # entries of a stage are applied after those of the previous ones
+    stage: int = 0
+
+
+CHECKPOINT_CHUNKS = 64  # chunks of a large head XORed per checkpoint
+
+
+@dataclass
+class Checkpoint:
+    """Progress of XORing a head larger than a chunk, journaled before each
+    span of chunks is written.
+
+    Bytes before `offset` are in the `head` state of the entry, "before" or
+    "after", and bytes past the span in the other one. Each chunk of the
+    span is in either, told apart by its digests."""
+
+    old: str
+    offset: int
+    head: str
+    before: list[str]
+    after: list[str]
+
+
+def _read_chunk(fp: BinaryIO, index: int, size: int) -> memoryview:
+    """chunk `index` of the first `size` bytes, in the thread's buffer"""
+    offset = index * CHUNK_SIZE
+    view = _get_buffer()[: min(CHUNK_SIZE, size - offset)]
+    fp.seek(offset)
+    fp.readinto(view)
+    return view
+
+
+def _chunk_digest(data: bytes | memoryview) -> str:
+    return blake2b(data, digest_size=16).hexdigest()
+
+
+def _xor_spans(
+    fp: BinaryIO,
+    entry: Entry,
+    want: str,
+    head: str,
+    chunks: Iterable[int],
+    journal: "Journal",
+) -> None:
+    """XOR `chunks` of the head of `entry` into the `want` state, journaling
+    a `Checkpoint` with `head` before each span of them, once the previous
+    span is synced"""
+    key = entry.key.encode()
+    for span in batched(chunks, CHECKPOINT_CHUNKS):
+        before: list[str] = []
+        after: list[str] = []
+        for index in sorted(span):
+            data = _read_chunk(fp, index, entry.size)
+            digests = (
+                _chunk_digest(data),
+                _chunk_digest(_xor_bytes(data, key, index * CHUNK_SIZE)),
+            )
+            if want == "before":
+                digests = digests[::-1]
+            before.append(digests[0])
+            after.append(digests[1])
+        fp.flush()
+        os.fsync(fp.fileno())
+        journal.checkpoint(
+            Checkpoint(entry.old, min(span) * CHUNK_SIZE, head, before, after)
+        )
+        for index in span:
+            data = _read_chunk(fp, index, entry.size)
+            fp.seek(index * CHUNK_SIZE)
+            fp.write(_xor_bytes(data, key, index * CHUNK_SIZE))
+    fp.flush()
+
+
+def _xor_resume(
+    fp: BinaryIO, entry: Entry, want: str, checkpoint: Checkpoint, journal: "Journal"
+) -> None:
+    """XOR the head of `entry` into the `want` state from where `checkpoint`
+    left it: first its span, then the rest on the side not in `want`"""
+    key = entry.key.encode()
+    digests = {"before": checkpoint.before, "after": checkpoint.after}
+    other = "before" if want == "after" else "after"
+    first = checkpoint.offset // CHUNK_SIZE
+    n_chunks = -(-entry.size // CHUNK_SIZE)
+    span = range(first, min(first + len(checkpoint.before), n_chunks))
+    for i, index in enumerate(span):
+        data = _read_chunk(fp, index, entry.size)
+        digest = _chunk_digest(data)
+        if digest == digests[want][i]:
+            continue
+        if digest != digests[other][i]:
+            raise ValueError(
+                f"chunk at {index * CHUNK_SIZE} of {fp.name} changed outside of "
+                "the batch"
+            )
+        fp.seek(index * CHUNK_SIZE)
+        fp.write(_xor_bytes(data, key, index * CHUNK_SIZE))
+    if checkpoint.head == want:
+        chunks: Iterable[int] = range(span.stop, n_chunks)
+    else:
+        # downwards, so that what is left is still a head
+        chunks = reversed(range(span.start))
+    _xor_spans(fp, entry, want, checkpoint.head, chunks, journal)
+
+
+def plan_file(
+    path: Path,
+    b64: MyBase64,
+    decrypt: bool = False,
+    size: int | None = BLOCK_SIZE,
+    dirs: bool = False,
+) -> Entry:
+    """what encrypting, or decrypting, `path` will do
+
+    With `dirs`, as for the directory stages of `walk_stages`, `path` may be
+    a directory, which is only renamed."""
+    if decrypt:
+        new_name, key = _parse_encrypt_name(path.name, b64=b64)
+    else:
+        key = _random_key()
+        new_name = _get_encrypt_name(path.name, key, b64=b64)
+    if dirs and path.is_dir():
+        size, ends = 0, [(0, b"")]
+    else:
+        with path.open("rb") as fp:
+            file_size = os.fstat(fp.fileno()).st_size
+            size = file_size if size is None else min(size, file_size)
+            ends = _ends(fp, size)
+    return Entry(
+        str(path.absolute()),
+        str(path.absolute().with_name(new_name)),
+        key.decode(),
+        _ends_digest(ends),
+        _ends_digest(ends, key),
+        size,
+    )
+
+
+def apply_entry(
+    entry: Entry, rollback: bool = False, journal: "Journal | None" = None
+) -> Path:
+    """bring the file of `entry` to its new state, or back to its old one
+    with `rollback`, from whichever state it was left in
+
+    With `journal`, a head larger than a chunk is XORed with checkpoints,
+    and resumed from the last one journaled for the entry.
+
+    An entry whose directory is gone counts as done, as after a resumed
+    `walk_stages` run that had renamed the directory."""
+    src, dst = (entry.new, entry.old) if rollback else (entry.old, entry.new)
+    want, other = (
+        (entry.before, entry.after) if rollback else (entry.after, entry.before)
+    )
+    if not any(map(osp.lexists, (src, dst, osp.dirname(dst)))):
+        # done, then moved along with its directory by a later stage
+        return Path(dst)
+    path = src if osp.lexists(src) else dst
+    state = "before" if rollback else "after"
+    checkpoint = journal.checkpoints.get(entry.old) if journal is not None else None
+    if entry.size > 0:
+        with open(path, "rb+") as fp:
+            if checkpoint is not None:
+                # the checkpoint knows better than the ends, which a span
+                # synced out of order may leave matching
+                _xor_resume(fp, entry, state, checkpoint, journal)  # type: ignore
+            else:
+                digest = _ends_digest(_ends(fp, entry.size))
+                if digest == other:
+                    if journal is not None and entry.size > CHUNK_SIZE:
+                        n_chunks = -(-entry.size // CHUNK_SIZE)
+                        _xor_spans(fp, entry, state, state, range(n_chunks), journal)
+                    else:
+                        _xor_file(fp, entry.key.encode(), entry.size)
+                elif digest != want:
+                    raise ValueError(f"head of {path} changed outside of the batch")
+    if path == src:
+        os.rename(src, dst)
+    return Path(dst)
+
+
+def settled(entry: Entry) -> bool:
+    """whether the file of `entry` is wholly in its old or its new state, or
+    gone, so that the journal has nothing left to recover for it"""
+    for path, digest in ((entry.old, entry.before), (entry.new, entry.after)):
+        if not osp.lexists(path):
+            continue
+        if entry.size == 0:
+            return True
+        try:
+            with open(path, "rb") as fp:
+                return _ends_digest(_ends(fp, entry.size)) == digest
+        except OSError:
+            return False
+    return True
+
+
+class Journal:
+    """Write-ahead log of a batch, as JSON lines of `Entry` and `Checkpoint`.
+
+    Entries are synced to disk before any of their files is touched, so an
+    interrupted batch can be resumed or rolled back with `apply_entry`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fp: TextIO | None = None
+        self._lock = threading.Lock()
+        # the last checkpoint of each entry, by its old path
+        self.checkpoints: dict[str, Checkpoint] = {}
+
+    def exists(self) -> bool:
+        return osp.exists(self.path)
+
+    def _write(self, records: Iterable[Entry | Checkpoint]) -> None:
+        with self._lock:
+            if self._fp is None:
+                os.makedirs(osp.dirname(osp.abspath(self.path)), exist_ok=True)
+                self._fp = open(self.path, "a", encoding="utf-8")
+            for record in records:
+                self._fp.write(json.dumps(asdict(record)) + "\n")
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+
+    def append(self, entries: list[Entry]) -> None:
+        for entry in entries:
+            # left from an earlier batch through the same path
+            self.checkpoints.pop(entry.old, None)
+        self._write(entries)
+
+    def checkpoint(self, checkpoint: Checkpoint) -> None:
+        self._write((checkpoint,))
+        self.checkpoints[checkpoint.old] = checkpoint
+
+    def read(self) -> list[Entry]:
+        entries = []
+        with open(self.path, encoding="utf-8") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "head" in record:
+                    checkpoint = Checkpoint(**record)
+                    self.checkpoints[checkpoint.old] = checkpoint
+                else:
+                    entries.append(Entry(**record))
+        return entries
+
+    def close(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def rewrite(self, entries: list[Entry]) -> None:
+        """replace the journal with `entries` and their last checkpoints,
+        removing it if there are none"""
+        self.close()
+        if not entries:
+            if self.exists():
+                os.unlink(self.path)
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            for entry in entries:
+                fp.write(json.dumps(asdict(entry)) + "\n")
+                if (checkpoint := self.checkpoints.get(entry.old)) is not None:
+                    fp.write(json.dumps(asdict(checkpoint)) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, self.path)
+
+
+BATCH_SIZE = 256  # entries per journal sync
+
+type Result = tuple[str, Path | Exception]
+
+
+def _catch[T](func: Callable[[T], Path]) -> Callable[[T], Path | Exception]:
+    def wrapper(arg: T) -> Path | Exception:
+        try:
+            return func(arg)
+        except Exception as e:
+            return e
+
+    return wrapper
+
+
+def walk_stages(paths: Iterable[Path], jobs: int = 1) -> list[list[Path]]:
+    """Split `paths` into stages to run one after the other.
+
+    Directories are walked on `jobs` threads. The first stage holds the
+    given files and the regular files under the directories. Then come
+    their subdirectories, deepest first, so that a directory is renamed
+    after everything in it. The given directories themselves are kept."""
+    files: list[Path] = []
+    dirs: dict[int, list[Path]] = defaultdict(list)
+    for path in paths:
+        if not path.is_dir():
+            files.append(path)
+            continue
+        for root in walk(str(path), jobs=jobs):
+            if root.error is not None:
+                print(f"[ERROR] {root.error}")
+            for entry in root.files:
+                if entry.is_file(follow_symlinks=False):
+                    files.append(Path(entry.path))
+            dirs[root.depth + 1].extend(Path(entry.path) for entry in root.dirs)
+    return [files] + [dirs[depth] for depth in sorted(dirs, reverse=True)]
+
+
+def crypt_files(
+    paths: Iterable[Path],
+    b64: MyBase64,
+    journal: Journal,
+    decrypt: bool = False,
+    jobs: int = 1,
+    size: int | None = BLOCK_SIZE,
+    recursive: bool = False,
+) -> Iterator[Result]:
+    """Encrypt, or decrypt, `paths` on `jobs` threads, yielding (path,
+    new path or error) in order. `size` is as for `encrypt_file`.
+    With `recursive`, directories are walked, see `walk_stages`.
+
+    Files go in batches: all entries of a batch are journaled first, then
+    applied. The journal is kept whole if the run is interrupted. Otherwise
+    it ends with only the failed entries that are not `settled`, and is
+    removed if there are none.
+
+    A file given more than once, or through another link, is done once:
+    XORing it twice with different keys would lose its content."""
+    stages = walk_stages(paths, jobs) if recursive else [paths]
+    seen: set[tuple[int, int]] = set()
+
+    def first_seen(path: Path) -> bool:
+        try:
+            st = path.stat()
+        except OSError:
+            # reported when planned
+            return True
+        key = (st.st_dev, st.st_ino)
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    failed: list[Entry] = []
+    ok = False
+    try:
+        for stage, stage_paths in enumerate(stages):
+            for chunk in batched(filter(first_seen, stage_paths), BATCH_SIZE):
+                planned = imap_ordered(
+                    _catch(lambda p: plan_file(p, b64, decrypt, size, stage > 0)),
+                    chunk,
+                    jobs,
+                )
+                entries: list[Entry] = []
+                for path, entry in zip(chunk, planned):
+                    if isinstance(entry, Exception):
+                        yield str(path), entry
+                    else:
+                        entry.stage = stage
+                        entries.append(entry)
+                journal.append(entries)
+
+                apply = partial(apply_entry, journal=journal)
+                results = imap_ordered(_catch(apply), entries, jobs)
+                for entry, result in zip(entries, results):
+                    if isinstance(result, Exception):
+                        failed.append(entry)
+                    yield entry.old, result
+        ok = True
+    finally:
+        if ok:
+            journal.rewrite([e for e in failed if not settled(e)])
+        else:
+            journal.close()
+
+
+def recover(
+    journal: Journal, rollback: bool = False, jobs: int = 1
+) -> Iterator[Result]:
+    """finish, or undo, the batch left in `journal`
+
+    Stages are replayed in order, or in reverse order with `rollback`.
+    Failed entries are reported, and dropped from the journal if they are
+    `settled`, as in `crypt_files`."""
+    entries = journal.read()
+    if rollback:
+        entries.reverse()
+    failed: list[Entry] = []
+    for _, group in groupby(entries, key=lambda e: e.stage):
+        stage = list(group)
+        apply = partial(apply_entry, rollback=rollback, journal=journal)
+        results = imap_ordered(_catch(apply), stage, jobs)
+        for entry, result in zip(stage, results):
+            if isinstance(result, Exception):
+                failed.append(entry)
+            yield (entry.new if rollback else entry.old), result
+    if rollback:
+        failed.reverse()
+    journal.rewrite([e for e in failed if not settled(e)])
+
+
 def main():
     import argparse
 
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument("path", nargs="+", help="file/path, glob supported")
+    parser.add_argument("path", nargs="*", help="file/path, glob supported")
     parser.add_argument("--seed", help="seed for base64 table")
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="process everything under the given directories, "
+        "renaming subdirectories after their contents",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"number of files to process in parallel, default: {DEFAULT_JOBS}",
+    )
+    size_grp = parser.add_mutually_exclusive_group()
+    size_grp.add_argument(
+        "--head-size",
+        type=parse_size,
+        default=BLOCK_SIZE,
+        help="bytes of the head to XOR, like 64K or 1M, default: 4K, "
+        "the same is needed to decrypt",
+    )
+    size_grp.add_argument(
+        "--full",
+        action="store_true",
+        help="XOR whole files, the same is needed to decrypt",
+    )
+    parser.add_argument(
+        "--journal",
+        default=osp.join(user_cache_dir(), "crypt_file.journal"),
+        help="write-ahead journal of the batch, default: %(default)s",
+    )
 
     cmd_grp = parser.add_mutually_exclusive_group(required=True)
     cmd_grp.add_argument("-e", "--encrypt", action="store_true", help="encrypt file")
     cmd_grp.add_argument("-d", "--decrypt", action="store_true", help="decrypt file")
     cmd_grp.add_argument("-g", "--glob", action="store_true", help="glob pattern")
+    cmd_grp.add_argument(
+        "--resume", action="store_true", help="finish an interrupted batch"
+    )
+    cmd_grp.add_argument(
+        "--rollback", action="store_true", help="undo an interrupted batch"
+    )
 
     args = parser.parse_args()
     # print(args)
 
-    paths = glob_paths(args.path)
-    paths = map(Path, paths)
-
-    if args.glob:
-        for path in paths:
-            print(path)
-        return
+    jobs: int = args.jobs or os.cpu_count() or 1
+    size: int | None = None if args.full else args.head_size
+    journal = Journal(args.journal)
+
+    if args.resume or args.rollback:
+        if not journal.exists():
+            print(f"no journal: {journal.path}")
+            return
+        results = recover(journal, args.rollback, jobs)
+    else:
+        if not args.path:
+            parser.error("the following arguments are required: path")
+
+        paths = glob_paths(args.path)
+        paths = map(Path, paths)
+
+        if args.glob:
+            for path in paths:
+                print(path)
+            return
+
+        if journal.exists():
+            print(f"[ERROR] unfinished batch in {journal.path}")
+            print("run again with --resume or --rollback")
+            return
+
+        b64 = get_base64(args.seed)
+        results = crypt_files(
+            paths, b64, journal, args.decrypt, jobs, size, args.recursive
+        )
 
-    b64 = MyBase64(args.seed)
-    fn = encrypt_file if args.encrypt else decrypt_file
-    for path in paths:
-        try:
-            new_name = fn(path, b64)
-        except Exception as e:
-            print(f"[ERROR] {e}")
-            continue
-        if new_name is None:
-            continue
-        print(f"[OK] {path} => {new_name}")
+    failed = False
+    for path, result in results:
+        if isinstance(result, Exception):
+            failed = True
+            print(f"[ERROR] {path}: {result}")
+        else:
+            print(f"[OK] {path} => {result}")
+    if failed and journal.exists():
+        print(f"journal kept in {journal.path}, see --resume and --rollback")
@@ -3,67 +3,440 @@
 """Disk usage? I don't know."""
 
 import argparse
+import heapq
+import json
 import os
 import os.path as osp
+import tempfile
 import time
-from typing import Iterable, Set
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from operator import itemgetter
+from stat import S_ISREG
+from typing import Iterable, Iterator, Sequence
 
-from ._common import human_readable_size
+from ._common import Progress, human_readable_size
+from ._walk import DEFAULT_JOBS, Prune, ScanResult, SubDir, scan_dir, walk
 
-type T_OS_WALKER = tuple[str, list[str], list[str]]
-type T_ITEM = tuple[int, int, int]
+type T_ITEM = tuple[int, int, int, int, int]
+# a hard-linked file: (st_dev, st_ino, size, allocated, sparse, counted here)
+type T_LINK = tuple[int, int, int, int, int, int]
 
+# not on Windows, where allocated size is taken as the apparent one
+HAS_BLOCKS = hasattr(os.stat_result, "st_blocks")
 
-def count_root(root: T_OS_WALKER) -> T_ITEM:
+
+class InodeSet:
+    """A compact set of (st_dev, st_ino).
+
+    Inodes are kept per device in sorted `array("Q")`, 8 bytes each instead of
+    a boxed int in a set. New ones are buffered in a small set, which is merged
+    in once it grows past 1/8 of the arrays."""
+
+    MIN_BUFFER = 1 << 16
+
+    def __init__(self):
+        self._sorted: dict[int, array] = {}
+        self._recent: dict[int, set[int]] = defaultdict(set)
+        self._len_sorted = 0
+        self._len_recent = 0
+
+    def __len__(self) -> int:
+        return self._len_sorted + self._len_recent
+
+    def __contains__(self, key: tuple[int, int]) -> bool:
+        dev, ino = key
+        if ino in self._recent.get(dev, ()):
+            return True
+        arr = self._sorted.get(dev)
+        if arr is None:
+            return False
+        i = bisect_left(arr, ino)
+        return i < len(arr) and arr[i] == ino
+
+    def add(self, key: tuple[int, int]) -> bool:
+        """add `key`, return False if it is already in the set"""
+        if key in self:
+            return False
+        dev, ino = key
+        self._recent[dev].add(ino)
+        self._len_recent += 1
+        if self._len_recent > max(self.MIN_BUFFER, self._len_sorted >> 3):
+            self._merge()
+        return True
+
+    def _merge(self) -> None:
+        for dev, recent in self._recent.items():
+            old = self._sorted.get(dev, array("Q"))
+            self._sorted[dev] = array("Q", heapq.merge(old, sorted(recent)))
+        self._recent.clear()
+        self._len_sorted += self._len_recent
+        self._len_recent = 0
+
+
+def count_root(
+    inode_set: InodeSet, root: ScanResult, links: list[T_LINK] | None = None
+) -> T_ITEM:
     """return a tuple of
-    (number of dirs, number of files, size of files)"""
-    r, d, f = root
-    pth = (osp.join(r, i) for i in f)
-    return len(d), len(f), sum(map(osp.getsize, pth))
+    (number of dirs, number of files, size of files,
+     allocated size of files, number of sparse files)
+
+    Files already seen through another hard link are skipped. Hard-linked
+    files are appended to `links` if given, whether counted here or not."""
+    nf, ns, na, nsp = 0, 0, 0, 0
+    for entry in root.files:
+        try:
+            # cached by the walker, no extra syscall
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if HAS_BLOCKS:
+            # st_blocks is in 512-byte units, whatever st_blksize is
+            allocated = st.st_blocks * 512
+            # holes, or a compressed filesystem
+            sparse = int(allocated < st.st_size and S_ISREG(st.st_mode))
+        else:
+            allocated, sparse = st.st_size, 0
+        # only hard-linked files can be seen twice; on Windows the cached
+        # stat has no st_nlink/st_ino, so links are counted each time
+        if st.st_nlink > 1:
+            new = inode_set.add((st.st_dev, st.st_ino))
+            if links is not None:
+                link = (st.st_dev, st.st_ino, st.st_size, allocated, sparse, int(new))
+                links.append(link)
+            if not new:
+                continue
+        nf += 1
+        ns += st.st_size
+        na += allocated
+        nsp += sparse
+    return len(root.dirs), nf, ns, na, nsp
+
+
+def count_reused(
+    inode_set: InodeSet, item: T_ITEM, links: list[T_LINK]
+) -> tuple[T_ITEM, list[T_LINK]]:
+    """Adjust the totals `item` of a directory counted in an earlier run to
+    the hard links seen so far in this one.
+
+    A file counted there may have been seen here through another link
+    first, and one skipped there may now be seen here first."""
+    dirs, nf, ns, na, nsp = item
+    relinked: list[T_LINK] = []
+    for dev, ino, size, allocated, sparse, counted in links:
+        new = inode_set.add((dev, ino))
+        if new != bool(counted):
+            sign = 1 if new else -1
+            nf += sign
+            ns += sign * size
+            na += sign * allocated
+            nsp += sign * sparse
+        relinked.append((dev, ino, size, allocated, sparse, int(new)))
+    return (dirs, nf, ns, na, nsp), relinked
+
+
+def _rel(top: str, path: str) -> str:
+    """`path` relative to `top`, which it is known to start with"""
+    return path[len(top) :].lstrip(os.sep + (os.altsep or ""))
 
 
-def count(directory: str, recursive: bool) -> Iterable[T_ITEM]:
-    inode_set = set()
-    tmp = os.walk(directory)
+@dataclass(slots=True)
+class DirRecord:
+    """What a snapshot keeps of one directory, `path` is relative to the top."""
 
-    first = trim_hardlinks_from_root(inode_set, next(tmp))
-    yield count_root(first)
+    path: str
+    mtime_ns: int
+    dirs: int
+    files: int
+    size: int
+    subdirs: list[str]
+    allocated: int = 0
+    sparse: int = 0
+    # hard-linked files, to count them once when the directory is reused
+    links: list[T_LINK] = field(default_factory=list)
 
-    if recursive:
-        tmp = (trim_hardlinks_from_root(inode_set, i) for i in tmp)
-        yield from map(count_root, tmp)
+    @classmethod
+    def of(
+        cls, top: str, root: ScanResult, item: T_ITEM, links: Iterable[T_LINK] = ()
+    ) -> "DirRecord":
+        mtime_ns = root.st.st_mtime_ns if root.st else 0
+        subdirs = [d.name for d in root.dirs]
+        dirs, files, size, allocated, sparse = item
+        return cls(
+            _rel(top, root.path),
+            mtime_ns,
+            dirs,
+            files,
+            size,
+            subdirs,
+            allocated,
+            sparse,
+            [list(link) for link in links],  # type: ignore
+        )
 
+    def item(self) -> T_ITEM:
+        return self.dirs, self.files, self.size, self.allocated, self.sparse
 
-def trim_hardlinks_from_root(inode_set: Set[int], root: T_OS_WALKER) -> T_OS_WALKER:
-    r, d, f = root
-    new_f = []
-    for i in f:
-        ff = osp.join(r, i)
-        inode = os.stat(ff).st_ino
-        if inode in inode_set:
+
+def load_snapshot(file: str) -> dict[str, DirRecord]:
+    with open(file, encoding="utf-8") as fp:
+        records = (DirRecord(**json.loads(line)) for line in fp if line.strip())
+        return {r.path: r for r in records}
+
+
+def covered_records(
+    snapshot: dict[str, DirRecord],
+    top: str,
+    recursive: bool = True,
+    prune: Prune | None = None,
+) -> Iterator[DirRecord]:
+    """the records of `snapshot` for the directories a walk of `top` with
+    `recursive` and `prune` covers, following the subdirs of the records
+
+    Directories gone since are covered too, their size is what was lost."""
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        if (record := snapshot.get(rel)) is None:
             continue
-        new_f.append(i)
-        inode_set.add(inode)
-    return r, d, new_f
+        yield record
+        if not recursive:
+            continue
+        path = osp.join(top, rel) if rel else top
+        match = prune.matcher(path) if prune is not None else None
+        for name in record.subdirs:
+            if match is None or not match(name, True):
+                stack.append(osp.join(rel, name))
+
+
+def save_snapshot(file: str, records: Iterable[DirRecord]) -> None:
+    """write JSON lines to `file`, replacing it atomically"""
+    file = osp.abspath(file)
+    fd, tmp = tempfile.mkstemp(dir=osp.dirname(file), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            for record in records:
+                fp.write(json.dumps(asdict(record)) + "\n")
+        os.replace(tmp, file)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def scan_since(
+    top: str,
+    snapshot: dict[str, DirRecord],
+    path: str,
+    depth: int,
+    prune: Prune | None = None,
+) -> ScanResult:
+    """List a directory only if its mtime differs from the snapshot.
+
+    A directory's mtime changes when entries are added, removed or renamed,
+    not when a file in it is rewritten in place; such growth is missed until
+    the directory itself changes. Reused directories keep the totals counted
+    with the filters of the snapshot run."""
+    record = snapshot.get(_rel(top, path))
+    if record is not None:
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            pass
+        else:
+            if st.st_mtime_ns == record.mtime_ns:
+                match = prune.matcher(path) if prune is not None else None
+                dirs = [
+                    SubDir(osp.join(path, n), n)
+                    for n in record.subdirs
+                    if match is None or not match(n, True)
+                ]
+                return ScanResult(path, depth, dirs, st=st, reused=True)  # type: ignore
+    return scan_dir(path, depth, stat=True, prune=prune)
+
+
+def count(
+    directory: str,
+    recursive: bool,
+    jobs: int = 1,
+    snapshot: dict[str, DirRecord] | None = None,
+    prune: Prune | None = None,
+) -> Iterable[tuple[ScanResult, T_ITEM, list[T_LINK]]]:
+    """yield every directory with its totals and hard-linked files
+
+    With `snapshot`, directories unchanged since are not listed again.
+    Entries matched by `prune` are not counted, nor descended into."""
+    inode_set = InodeSet()
+    scan = partial(scan_since, directory, snapshot, prune=prune) if snapshot else None
+    for root in walk(
+        directory, recursive, jobs=jobs, stat=True, prune=prune, scan=scan
+    ):
+        if snapshot and root.reused:
+            record = snapshot[_rel(directory, root.path)]
+            yield root, *count_reused(inode_set, record.item(), record.links)
+        else:
+            links: list[T_LINK] = []
+            yield root, count_root(inode_set, root, links), links
+
+
+class Breakdown:
+    """Sizes of the subtrees under `top`, rolled up to `max_depth`.
 
+    Only directories up to `max_depth` are kept, whatever the tree size."""
 
-def run(director: str, recursive: bool = True):
-    print("\n", osp.abspath(director), "\n")
+    def __init__(self, top: str, max_depth: int = 1):
+        self.top = top
+        self.max_depth = max_depth
+        self.sizes: dict[str, int] = defaultdict(int)
+
+    def add(self, path: str, size: int) -> None:
+        rel = _rel(self.top, path)
+        if not rel or size == 0:
+            return
+        parts = rel.split(os.sep, self.max_depth)[: self.max_depth]
+        # add to every ancestor within max_depth
+        for i in range(1, len(parts) + 1):
+            self.sizes[osp.join(self.top, *parts[:i])] += size
+
+    def largest(self, n: int) -> list[tuple[str, int]]:
+        return heapq.nlargest(n, self.sizes.items(), key=itemgetter(1))
+
+
+def _signed_size(size: int) -> str:
+    return ("+" if size >= 0 else "-") + human_readable_size(abs(size))
+
+
+def _jsonl(record: dict) -> None:
+    print(json.dumps(record))
+
+
+def run(
+    director: str,
+    recursive: bool = True,
+    jobs: int = 1,
+    top_n: int = 0,
+    max_depth: int = 1,
+    since: str | None = None,
+    save: str | None = None,
+    allocated: bool = False,
+    jsonl: bool = False,
+    exclude: Sequence[str] = (),
+    gitignore: bool = False,
+):
+    """`allocated` sizes the breakdown and deltas by allocated bytes.
+    `exclude` globs and, with `gitignore`, .gitignore files prune the walk.
+
+    With `jsonl`, a JSON record is printed per directory as it is counted,
+    then a summary record, instead of the progress line and report."""
+    snapshot = None
+    if since is not None:
+        try:
+            snapshot = load_snapshot(since)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[ERROR] bad snapshot {since}: {e}")
+            return
+    if not jsonl:
+        print("\n", osp.abspath(director), "\n")
     begin = time.perf_counter()
-    nd, nf, ns = 0, 0, 0
+    breakdown = Breakdown(director, max_depth)
+    records: list[DirRecord] = []
+    prune = Prune(director, exclude, gitignore) if exclude or gitignore else None
+    progress = Progress()
+    progress.enabled &= not jsonl
+    nd, nf, ns, na, nsp = 0, 0, 0, 0, 0
     try:
-        for d, f, s in count(director, recursive):
+        for root, item, links in count(director, recursive, jobs, snapshot, prune):
+            d, f, s, a, sp = item
+            if top_n > 0:
+                breakdown.add(root.path, a if allocated else s)
+            if save is not None:
+                records.append(DirRecord.of(director, root, item, links))
             nd += d
             nf += f
             ns += s
-            print(f"\r  {nd} dir(s)  {nf} file(s)  {ns:,} bytes", end="", flush=True)
+            na += a
+            nsp += sp
+            if jsonl:
+                _jsonl(
+                    {
+                        "type": "dir",
+                        "path": root.path,
+                        "dirs": d,
+                        "files": f,
+                        "size": s,
+                        "allocated": a,
+                        "sparse": sp,
+                    }
+                )
+            else:
+                text = f"  {nd} dir(s)  {nf} file(s)  {ns:,} bytes"
+                progress.update(nd + nf, text)
     except KeyboardInterrupt:
-        pass
+        # a partial snapshot would hide the rest of the tree next time
+        save = None
     finally:
         end = time.perf_counter()
-        h = human_readable_size(ns)
-        print(f" ({h})")
-        print(f"\n cost time: {end - begin:.3f}s")
+        deltas: list[tuple[str, int]] = []
+        old_ns, old_na = 0, 0
+        if snapshot is not None:
+            # only what this run covers, with -R or --exclude it is less
+            covered = list(covered_records(snapshot, director, recursive, prune))
+            old_ns = sum(r.size for r in covered)
+            old_na = sum(r.allocated for r in covered)
+            if top_n > 0:
+                old = Breakdown(director, max_depth)
+                for r in covered:
+                    size = r.allocated if allocated else r.size
+                    old.add(osp.join(director, r.path), size)
+                all_deltas = {
+                    path: breakdown.sizes.get(path, 0) - old.sizes.get(path, 0)
+                    for path in breakdown.sizes.keys() | old.sizes.keys()
+                }
+                deltas = heapq.nlargest(
+                    top_n, all_deltas.items(), key=lambda x: abs(x[1])
+                )
+                deltas = [(path, delta) for path, delta in deltas if delta != 0]
+
+        if jsonl:
+            summary = {
+                "type": "summary",
+                "path": director,
+                "dirs": nd,
+                "files": nf,
+                "size": ns,
+                "allocated": na,
+                "sparse": nsp,
+                "seconds": round(end - begin, 3),
+            }
+            if top_n > 0:
+                summary["top"] = breakdown.largest(top_n)
+            if snapshot is not None:
+                summary["size_delta"] = ns - old_ns
+                summary["allocated_delta"] = na - old_na
+                if top_n > 0:
+                    summary["top_deltas"] = deltas
+            _jsonl(summary)
+        else:
+            progress.clear()
+            h = human_readable_size(ns)
+            print(f"  {nd} dir(s)  {nf} file(s)  {ns:,} bytes ({h})")
+            print(f"  {na:,} bytes allocated ({human_readable_size(na)})", end="")
+            print(f"  {nsp} sparse file(s)" if nsp else "")
+            if top_n > 0:
+                print()
+                for path, size in breakdown.largest(top_n):
+                    print(f"  {human_readable_size(size):>10}  {path}")
+            if snapshot is not None:
+                print(f"\n  {_signed_size(ns - old_ns)} since {since}", end="")
+                print(f"  ({_signed_size(na - old_na)} allocated)")
+                for path, delta in deltas:
+                    print(f"  {_signed_size(delta):>11}  {path}")
+            print(f"\n cost time: {end - begin:.3f}s")
+
+    if save is not None:
+        save_snapshot(save, records)
 
 
 def main():
@@ -77,6 +450,64 @@ def main():
         action="store_true",
         help="don't recurse into subdirectories",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"number of directories to list in parallel, default: {DEFAULT_JOBS}",
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        dest="top_n",
+        type=int,
+        default=0,
+        help="list the N largest subdirectories",
+    )
+    parser.add_argument(
+        "-d",
+        "--max-depth",
+        type=int,
+        default=1,
+        help="with --top, how deep subdirectories are listed, default: 1",
+    )
+    parser.add_argument(
+        "-a",
+        "--allocated",
+        action="store_true",
+        help="with --top, rank by allocated instead of apparent size",
+    )
+    parser.add_argument(
+        "--save",
+        metavar="SNAPSHOT",
+        help="save per-directory totals and mtimes to SNAPSHOT",
+    )
+    parser.add_argument(
+        "--since",
+        metavar="SNAPSHOT",
+        help="report growth since SNAPSHOT, "
+        "directories unchanged since then are not listed again",
+    )
+    parser.add_argument(
+        "--exclude",
+        metavar="PATTERN",
+        action="append",
+        default=[],
+        help="skip entries matching the glob PATTERN, can be repeated",
+    )
+    parser.add_argument(
+        "--gitignore",
+        action="store_true",
+        help="skip .git and entries ignored by .gitignore files",
+    )
+    parser.add_argument(
+        "--json",
+        "--jsonl",
+        dest="jsonl",
+        action="store_true",
+        help="print a JSON line per directory and a summary line, no progress",
+    )
 
     args = parser.parse_args()
     # print(args)
@@ -84,8 +515,29 @@ def main():
 
     top: str = args.top
     not_r: bool = args.not_recursive
+    jobs: int = args.jobs
+    top_n: int = args.top_n
+    max_depth: int = args.max_depth
+    since: str | None = args.since
+    save: str | None = args.save
+    allocated: bool = args.allocated
+    jsonl: bool = args.jsonl
+    exclude: list[str] = args.exclude
+    gitignore: bool = args.gitignore
 
     if not osp.isdir(top):
         print(f"not a dir: {top}")
     else:
-        run(top, not not_r)
+        run(
+            top,
+            not not_r,
+            jobs,
+            top_n,
+            max_depth,
+            since,
+            save,
+            allocated,
+            jsonl,
+            exclude,
+            gitignore,
+        )
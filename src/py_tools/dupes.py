@@ -0,0 +1,157 @@
+"""Find duplicate files.
+
+Files are grouped by size, then by a digest of their first and last 64KB,
+and only the remaining candidates are hashed in full.
+Glob supported."""
+
+import argparse
+import hashlib
+import os
+import stat
+import sys
+from collections import defaultdict
+from contextlib import nullcontext
+from functools import partial
+from typing import Callable, Hashable, Iterable
+
+from ._cache import DigestCache
+from ._common import glob_paths, human_readable_size, imap_ordered
+from .hashsum import hash_file
+
+PROBE_SIZE = 1 << 16  # 64KB
+
+
+def probe_digest(path: str, size: int) -> str:
+    """digest of the first and last PROBE_SIZE bytes of a file"""
+    obj = hashlib.blake2b()
+    with open(path, "rb") as fp:
+        obj.update(fp.read(PROBE_SIZE))
+        if size > PROBE_SIZE:
+            fp.seek(max(PROBE_SIZE, size - PROBE_SIZE))
+            obj.update(fp.read(PROBE_SIZE))
+    return obj.hexdigest()
+
+
+type Group = tuple[int, list[str]]  # (size, paths)
+
+
+def _regroup[K: Hashable](
+    groups: Iterable[Group],
+    key: Callable[[str, int], K],
+    jobs: int,
+) -> list[Group]:
+    """Split every group by `key(path, size)`, computed on `jobs` threads.
+
+    Groups left with a single path are dropped. Unreadable paths are skipped."""
+    items = [(path, size) for size, paths in groups for path in paths]
+
+    def safe_key(item: tuple[str, int]) -> K | None:
+        try:
+            return key(*item)
+        except OSError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return None
+
+    buckets: dict[tuple[int, K], list[str]] = defaultdict(list)
+    for (path, size), k in zip(items, imap_ordered(safe_key, items, jobs)):
+        if k is not None:
+            buckets[size, k].append(path)
+    return [(size, paths) for (size, _), paths in buckets.items() if len(paths) > 1]
+
+
+def find_dupes(
+    paths: Iterable[str],
+    jobs: int = 1,
+    cache: DigestCache | None = None,
+) -> list[Group]:
+    """return groups of files with the same content, as (size, paths)
+
+    Hard links to one file count once, empty files are ignored."""
+    by_size: dict[int, list[str]] = defaultdict(list)
+    seen: set[tuple[int, int]] = set()
+    for path in paths:
+        try:
+            st = os.lstat(path)
+        except OSError as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            continue
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            continue
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        by_size[st.st_size].append(path)
+
+    groups = [(size, paths) for size, paths in by_size.items() if len(paths) > 1]
+    groups = _regroup(groups, probe_digest, jobs)
+
+    # the probe has read files of at most 2 probes in full
+    done = [g for g in groups if g[0] <= 2 * PROBE_SIZE]
+    todo = [g for g in groups if g[0] > 2 * PROBE_SIZE]
+
+    full = partial(hash_file, "sha256", cache=cache)
+    return done + _regroup(todo, lambda path, _: full(path).digest, jobs)
+
+
+def hardlink(src: str, dst: str) -> None:
+    """replace `dst` with a hard link to `src` atomically"""
+    tmp = f"{dst}.dupes-tmp"
+    os.link(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    except OSError:
+        os.unlink(tmp)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", nargs="+", help="files, glob supported")
+    parser.add_argument(
+        "-r", "--recursive", action="store_true", help="let ** match directories"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to hash in parallel, 0 means all CPUs",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse digests of unchanged files from the user cache dir",
+    )
+    parser.add_argument(
+        "--hardlink",
+        action="store_true",
+        help="replace duplicates with hard links to the first file of each group",
+    )
+
+    args = parser.parse_args()
+
+    jobs: int = args.jobs or os.cpu_count() or 1
+    paths = glob_paths(args.path, args.recursive, only_file=True)
+
+    with DigestCache() if args.cache else nullcontext() as cache:
+        groups = find_dupes(paths, jobs, cache)
+
+    wasted = 0
+    for size, group in groups:
+        wasted += size * (len(group) - 1)
+        print(f"{size:,} bytes each:")
+        first, *others = group
+        print(f"  {first}")
+        for path in others:
+            if args.hardlink:
+                try:
+                    hardlink(first, path)
+                except OSError as e:
+                    print(f"[ERROR] {e}")
+                    continue
+                print(f"  {path} => {first}")
+            else:
+                print(f"  {path}")
+        print()
+
+    print(f"{len(groups)} group(s), {human_readable_size(wasted)} duplicated")
@@ -1,15 +1,35 @@
 """Calculate file hashsum.
 
 Given file path, or read from stdin.
-Glob supported."""
+Glob supported, `-` hashes the content of stdin."""
 
 import argparse
 import hashlib
+import mmap
+import os
 import os.path as op
+import stat
 import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
+from functools import partial
+from itertools import chain
+from typing import BinaryIO, Iterable, Iterator, Sequence
 
-from ._common import glob_paths
+from ._cache import DigestCache
+from ._common import (
+    glob_paths,
+    human_readable_size,
+    imap_ordered,
+    parse_size,
+    read_names,
+)
+
+STDIN = "-"
 
 
 @dataclass
@@ -21,59 +41,570 @@ class HashLine:
         return f"{self.digest}  {self.path}"
 
 
-def hash_file(alg: str, file: str) -> HashLine:
-    with open(file, "rb") as fp:
-        # 3.11+
-        obj = hashlib.file_digest(fp, alg)
-    return HashLine(obj.hexdigest(), str(file))
+BUFFER_SIZE = 1 << 18  # 256KB, the same as hashlib.file_digest
+MMAP_THRESHOLD = 1 << 26  # 64MB
+
+_local = threading.local()
+
+
+def _get_buffer(size: int) -> memoryview:
+    """A read buffer reused across files by the calling thread."""
+    view: memoryview | None = getattr(_local, "view", None)
+    if view is None or len(view) != size:
+        view = _local.view = memoryview(bytearray(size))
+    return view
+
+
+def _advise_sequential(fd: int) -> None:
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+TREE_SUFFIX = "-tree"
+TREE_ALGS = ("blake2b" + TREE_SUFFIX, "blake2s" + TREE_SUFFIX)
+TREE_LEAF_SIZE = 1 << 22  # 4MB
+
+_leaf_pool: ThreadPoolExecutor | None = None
+_leaf_pool_lock = threading.Lock()
+
+
+def _get_leaf_pool() -> ThreadPoolExecutor:
+    """A process-wide pool for tree leaves, shared by all files."""
+    global _leaf_pool
+    with _leaf_pool_lock:
+        if _leaf_pool is None:
+            _leaf_pool = ThreadPoolExecutor(os.cpu_count())
+        return _leaf_pool
+
+
+def _tree_node(alg: str, **params):
+    new = hashlib.blake2b if alg == "blake2b" else hashlib.blake2s
+    return new(
+        fanout=0,
+        depth=2,
+        leaf_size=TREE_LEAF_SIZE,
+        inner_size=new.MAX_DIGEST_SIZE,
+        **params,
+    )
+
+
+def _tree_leaf(alg: str, count: int, index: int, data) -> bytes:
+    obj = _tree_node(alg, node_offset=index, last_node=index == count - 1)
+    obj.update(data)
+    return obj.digest()
+
+
+def _read_full(fp: BinaryIO, view: memoryview) -> int:
+    """readinto until `view` is full or EOF, a pipe may return less."""
+    total = 0
+    while total < len(view) and (size := fp.readinto(view[total:])):
+        total += size
+    return total
+
+
+def _tree_digest(fp: BinaryIO, alg: str, st: os.stat_result | None = None) -> str:
+    """BLAKE2 tree mode: a root node over the digests of 4MB leaves.
+
+    The leaves of a regular file are memory-mapped and digested in parallel,
+    other streams are read leaf by leaf. The digest differs from the plain,
+    sequential one."""
+    alg = alg.removesuffix(TREE_SUFFIX)
+    leaves: list[bytes] = []
+
+    mm = None
+    if st is not None and stat.S_ISREG(st.st_mode) and st.st_size > 0:
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass
+
+    if mm is not None:
+        with mm, memoryview(mm) as view:
+            count = -(-len(view) // TREE_LEAF_SIZE)
+            blocks = [
+                view[i * TREE_LEAF_SIZE : (i + 1) * TREE_LEAF_SIZE]
+                for i in range(count)
+            ]
+            fn = partial(_tree_leaf, alg, count)
+            if count == 1:
+                leaves = [fn(0, blocks[0])]
+            else:
+                leaves = list(_get_leaf_pool().map(fn, range(count), blocks))
+            for block in blocks:
+                block.release()
+    else:
+        # read one leaf ahead to know which one is the last
+        cur, nxt = (memoryview(bytearray(TREE_LEAF_SIZE)) for _ in range(2))
+        size = _read_full(fp, cur)
+        while True:
+            next_size = _read_full(fp, nxt) if size == TREE_LEAF_SIZE else 0
+            index = len(leaves)
+            count = index + 1 if next_size == 0 else index + 2
+            leaves.append(_tree_leaf(alg, count, index, cur[:size]))
+            if next_size == 0:
+                break
+            cur, nxt, size = nxt, cur, next_size
+
+    root = _tree_node(alg, node_depth=1, last_node=True)
+    for leaf in leaves:
+        root.update(leaf)
+    return root.hexdigest()
+
+
+def _digest_fp(
+    fp: BinaryIO,
+    algs: Sequence[str],
+    block_size: int = BUFFER_SIZE,
+    st: os.stat_result | None = None,
+) -> list[str]:
+    """Read `fp` once, feeding every block to one hash object per algorithm.
+
+    Large regular files (see `st`) are memory-mapped, the rest are read
+    into a reusable buffer."""
+    if len(algs) == 1 and algs[0] in TREE_ALGS:
+        return [_tree_digest(fp, algs[0], st)]
+
+    objs = [hashlib.new(alg) for alg in algs]
+
+    if st is not None and stat.S_ISREG(st.st_mode) and st.st_size >= MMAP_THRESHOLD:
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass
+        else:
+            with mm, memoryview(mm) as view:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                for i in range(0, len(view), block_size):
+                    block = view[i : i + block_size]
+                    for obj in objs:
+                        obj.update(block)
+                    block.release()
+            return [obj.hexdigest() for obj in objs]
+
+    view = _get_buffer(block_size)
+    while size := fp.readinto(view):
+        block = view[:size]
+        for obj in objs:
+            obj.update(block)
+    return [obj.hexdigest() for obj in objs]
+
+
+def hash_file_algs(
+    algs: Sequence[str],
+    file: str,
+    cache: DigestCache | None = None,
+    *,
+    block_size: int = BUFFER_SIZE,
+    refresh: bool = False,
+) -> list[HashLine]:
+    """Hash `file` with several algorithms in a single pass.
+
+    Lines are returned in the order of `algs`. With `refresh`, `cache` is
+    only written, never read."""
+    if file == STDIN:
+        digests = _digest_fp(sys.stdin.buffer, algs, block_size, None)
+        return [HashLine(digest, file) for digest in digests]
+
+    digests: dict[str, str] = {}
+    with open(file, "rb", buffering=0) as fp:
+        st = os.fstat(fp.fileno())
+        # a pipe or device has no stable content to cache
+        if not stat.S_ISREG(st.st_mode):
+            cache = None
+        if cache is not None and not refresh:
+            for alg in algs:
+                if (digest := cache.get(alg, st)) is not None:
+                    digests[alg] = digest
+
+        todo = [alg for alg in dict.fromkeys(algs) if alg not in digests]
+        if todo:
+            _advise_sequential(fp.fileno())
+            digests.update(zip(todo, _digest_fp(fp, todo, block_size, st)))
+            if cache is not None:
+                for alg in todo:
+                    cache.put(alg, st, digests[alg])
+
+    return [HashLine(digests[alg], str(file)) for alg in algs]
 
 
-def check_sum(alg: str, file: str) -> None:
-    with open(file) as fp:
+def hash_file(
+    alg: str,
+    file: str,
+    cache: DigestCache | None = None,
+    *,
+    block_size: int = BUFFER_SIZE,
+    refresh: bool = False,
+) -> HashLine:
+    return hash_file_algs((alg,), file, cache, block_size=block_size, refresh=refresh)[
+        0
+    ]
+
+
+def hash_files(
+    alg: str,
+    files: Iterable[str],
+    jobs: int = 1,
+    cache: DigestCache | None = None,
+    *,
+    block_size: int = BUFFER_SIZE,
+) -> Iterator[HashLine]:
+    """Hash `files` on `jobs` threads, yielding lines in input order.
+
+    hashlib releases the GIL while digesting, so threads scale across cores."""
+    fn = partial(hash_file, alg, cache=cache, block_size=block_size)
+    return imap_ordered(fn, files, jobs)
+
+
+def read_hash_lines(file: str) -> Iterator[HashLine | None]:
+    """Parse a hash sum file, yielding None for malformed lines."""
+    with nullcontext(sys.stdin) if file == STDIN else open(file) as fp:
         for line in fp:
-            tmp = line.strip().split()
+            tmp = line.strip().split(maxsplit=1)
             if len(tmp) != 2:
-                # print(f'bad line: {line}')
-                continue
-            digest, file = tmp
-            if not op.exists(file):
-                # print(f'not found: {file}')
+                yield None
                 continue
-            hash_line = hash_file(alg, file)
-            if hash_line.digest == digest:
-                print(f"OK: {file}")
+            digest, path = tmp
+            # GNU tools mark binary mode with a leading `*`
+            yield HashLine(digest.lower(), path.removeprefix("*"))
+
+
+@dataclass
+class CheckSummary:
+    ok: int = 0
+    failed: int = 0
+    missing: int = 0
+    bad_lines: int = 0
+    nbytes: int = 0
+
+    @property
+    def passed(self) -> bool:
+        return self.failed == 0 and self.missing == 0
+
+    def report(self, seconds: float) -> str:
+        rate = human_readable_size(int(self.nbytes / seconds)) if seconds else "-"
+        return (
+            f"{self.ok} OK, {self.failed} do NOT match, {self.missing} not found, "
+            f"{self.bad_lines} bad line(s); "
+            f"{human_readable_size(self.nbytes)} in {seconds:.3f}s ({rate}/s)"
+        )
+
+
+def _verify(
+    alg: str, cache: DigestCache | None, block_size: int, line: HashLine
+) -> tuple[HashLine, bool | None, int]:
+    """return (line, matched or None if unreadable, bytes read)
+
+    The content is always read, a cached digest would hide bitrot or
+    tampering that left size and mtime alone."""
+    try:
+        size = op.getsize(line.path)
+        hash_line = hash_file(
+            alg, line.path, cache, block_size=block_size, refresh=True
+        )
+    except OSError:
+        return line, None, 0
+    return line, hash_line.digest == line.digest, size
+
+
+def check_sum(
+    alg: str,
+    file: str,
+    cache: DigestCache | None = None,
+    jobs: int = 1,
+    fail_fast: bool = False,
+    summary: CheckSummary | None = None,
+    *,
+    block_size: int = BUFFER_SIZE,
+) -> CheckSummary:
+    """Verify the entries of hash sum `file`, `jobs` at a time.
+
+    With `fail_fast`, stop at the first entry that does not match or is missing.
+    Counts are accumulated into `summary`, which is returned."""
+    if summary is None:
+        summary = CheckSummary()
+
+    lines = []
+    for line in read_hash_lines(file):
+        if line is None:
+            summary.bad_lines += 1
+        else:
+            lines.append(line)
+
+    fn = partial(_verify, alg, cache, block_size)
+    for line, matched, size in imap_ordered(fn, lines, jobs):
+        summary.nbytes += size
+        if matched is None:
+            summary.missing += 1
+            print(f"not found: {line.path}")
+        elif matched:
+            summary.ok += 1
+            print(f"OK: {line.path}")
+        else:
+            summary.failed += 1
+            print(f"do NOT match: {line.path}")
+
+        if fail_fast and not summary.passed:
+            break
+
+    return summary
+
+
+@dataclass
+class UpdateSummary:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+    def report(self) -> str:
+        return (
+            f"{self.added} added, {self.updated} updated, "
+            f"{self.removed} removed, {self.unchanged} unchanged"
+        )
+
+
+def update_manifest(
+    alg: str,
+    manifest: str,
+    files: Iterable[str] = (),
+    cache: DigestCache | None = None,
+    jobs: int = 1,
+    *,
+    block_size: int = BUFFER_SIZE,
+) -> UpdateSummary:
+    """Bring hash sum file `manifest` up to date, adding `files` to it.
+
+    Entries whose file is gone are dropped. Only new files and files changed
+    since the previous update started are hashed again; the rest keep their
+    digest. The manifest is replaced atomically, with the start time of the
+    update as its mtime."""
+    # files changed while this update runs must look changed to the next one
+    start = time.time_ns()
+    summary = UpdateSummary()
+    old: dict[str, str] = {}
+    since = -1
+    if op.exists(manifest):
+        since = os.stat(manifest).st_mtime_ns
+        for line in read_hash_lines(manifest):
+            if line is not None:
+                old[line.path] = line.digest
+
+    me = op.abspath(manifest)
+    paths = dict.fromkeys(chain(old, (f for f in files if op.abspath(f) != me)))
+
+    # placeholders keep the order of entries to be hashed
+    lines: dict[str, HashLine | None] = {}
+    todo: list[str] = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            summary.removed += 1
+            continue
+        # ctime catches files moved or copied in with an old mtime
+        if path in old and max(st.st_mtime_ns, st.st_ctime_ns) < since:
+            lines[path] = HashLine(old[path], path)
+            summary.unchanged += 1
+        else:
+            lines[path] = None
+            todo.append(path)
+
+    fn = partial(hash_file, alg, cache=cache, block_size=block_size)
+    for line in imap_ordered(fn, todo, jobs):
+        if line.path not in old:
+            summary.added += 1
+        elif old[line.path] != line.digest:
+            summary.updated += 1
+        else:
+            summary.unchanged += 1
+        lines[line.path] = line
+
+    fd, tmp = tempfile.mkstemp(dir=op.dirname(me), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            for line in lines.values():
+                fp.write(f"{line}\n")
+        # mkstemp makes it 0600, keep the manifest readable as it was
+        if op.exists(manifest):
+            mode = stat.S_IMODE(os.stat(manifest).st_mode)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp, mode)
+        os.utime(tmp, ns=(start, start))
+        os.replace(tmp, manifest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    return summary
+
+
+def expand_paths(patterns: Iterable[str]) -> Iterator[str]:
+    """Glob each pattern into files, passing `-` (stdin) through."""
+    for pattern in patterns:
+        if pattern == STDIN:
+            yield pattern
+        else:
+            yield from glob_paths((pattern,), only_file=True)
+
+
+def _names_from(file: str, sep: bytes, missing: list[str]) -> Iterator[str]:
+    """Yield the names listed in `file` that are files, reporting the others
+    to stderr and collecting them in `missing`."""
+    with nullcontext(sys.stdin.buffer) if file == STDIN else open(file, "rb") as fp:
+        for name in read_names(fp, sep):
+            if op.isfile(name):
+                yield name
             else:
-                print(f"do NOT match: {file}")
+                print(f"[ERROR] {name}: not a file", file=sys.stderr)
+                missing.append(name)
 
 
 def gen_main(alg):
     def main():
         parser = argparse.ArgumentParser(description=__doc__)
-        parser.add_argument("file", nargs="*", help="files to hash")
+        parser.add_argument("file", nargs="*", help="files to hash, - for stdin")
+        parser.add_argument(
+            "--files-from",
+            metavar="FILE",
+            help="read names of files to hash from FILE, - for stdin",
+        )
+        parser.add_argument(
+            "-0",
+            "--null",
+            action="store_true",
+            help="names read by --files-from are NUL separated",
+        )
         parser.add_argument(
             "--check", "-c", action="store_true", help="check a hash sum file"
         )
+        parser.add_argument(
+            "--fail-fast",
+            action="store_true",
+            help="with --check, stop at the first mismatch or missing file",
+        )
+        parser.add_argument(
+            "--update",
+            metavar="MANIFEST",
+            help="add files to MANIFEST and refresh its changed and deleted entries",
+        )
+        parser.add_argument(
+            "--algs",
+            help=f"comma separated algorithms to compute in one pass, "
+            f"printed in BSD tag style, default: {alg}",
+        )
+        if alg + TREE_SUFFIX in TREE_ALGS:
+            parser.add_argument(
+                "--tree",
+                action="store_true",
+                help="parallel tree mode for large files, "
+                "the digest differs from the plain one",
+            )
+        parser.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            default=1,
+            help="number of files to hash in parallel, 0 means all CPUs",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="reuse digests of unchanged files from the user cache dir, "
+            "--check only refreshes it",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=parse_size,
+            default=BUFFER_SIZE,
+            help="read block size, e.g. 1M, default: 256K",
+        )
 
         args = parser.parse_args()
         files = args.file
         is_check: bool = args.check
+        jobs: int = args.jobs or os.cpu_count() or 1
+        block_size: int = args.block_size
+        # tree mode hashes under its own name, also in the digest cache
+        hash_alg = alg + TREE_SUFFIX if getattr(args, "tree", False) else alg
+        algs: list[str] = args.algs.lower().split(",") if args.algs else []
+
+        for a in algs:
+            # shake_* need a digest length, which we don't take
+            if a not in hashlib.algorithms_available or a.startswith("shake_"):
+                parser.error(f"unsupported algorithm: {a}")
+        if algs and hash_alg != alg:
+            parser.error("--algs is not supported with --tree")
+        if algs and is_check:
+            parser.error("--algs is not supported with --check")
+        update: str | None = args.update
+        if update is not None and (is_check or algs):
+            parser.error("--update is not supported with --check or --algs")
 
-        if len(files) == 0 and not sys.stdin.isatty():
-            files = sys.stdin.read().splitlines()
-        if len(files) == 0:
+        files_from: str | None = args.files_from
+        sep = b"\0" if args.null else b"\n"
+        # names from --files-from that are not files
+        missing: list[str] = []
+
+        if files_from is not None:
+            if files and files_from == STDIN and STDIN in files:
+                parser.error("stdin can't be both --files-from and a file")
+            # names are taken as is, no glob
+            files = chain(expand_paths(files), _names_from(files_from, sep, missing))
+        elif len(files) > 0:
+            files = expand_paths(files)
+        elif not sys.stdin.isatty():
+            files = glob_paths(read_names(sys.stdin.buffer, sep), only_file=True)
+        elif update is None:
             parser.print_help()
             parser.exit(1)
 
-        files = glob_paths(files, only_file=True)
+        with DigestCache() if args.cache else nullcontext() as cache:
+            if is_check:
+                begin = time.perf_counter()
+                summary = CheckSummary()
+                for file in files:
+                    check_sum(
+                        hash_alg,
+                        file,
+                        cache,
+                        jobs,
+                        args.fail_fast,
+                        summary,
+                        block_size=block_size,
+                    )
+                    if args.fail_fast and not summary.passed:
+                        break
+                seconds = time.perf_counter() - begin
+                print(summary.report(seconds), file=sys.stderr)
+                if not summary.passed or missing:
+                    parser.exit(1)
+                return
 
-        if is_check:
-            for file in files:
-                check_sum(alg, file)
-            return
+            if update is not None:
+                summary = update_manifest(
+                    hash_alg, update, files, cache, jobs, block_size=block_size
+                )
+                print(summary.report(), file=sys.stderr)
+            elif algs:
+                fn = partial(hash_file_algs, algs, cache=cache, block_size=block_size)
+                for lines in imap_ordered(fn, files, jobs):
+                    for a, line in zip(algs, lines):
+                        print(f"{a.upper()} ({line.path}) = {line.digest}")
+            else:
+                for line in hash_files(
+                    hash_alg, files, jobs, cache, block_size=block_size
+                ):
+                    print(line)
 
-        for file in files:
-            line = hash_file(alg, file)
-            print(line)
+        if missing:
+            parser.exit(1)
 
     return main
 
@@ -84,3 +615,5 @@ sha224 = gen_main("sha224")
 sha256 = gen_main("sha256")
 sha384 = gen_main("sha384")
 sha512 = gen_main("sha512")
+blake2b = gen_main("blake2b")
+blake2s = gen_main("blake2s")
@@ -2,15 +2,77 @@
 
 """List file extensions in a directory."""
 
+import json
 import math
 import os
 import sys
+import threading
 import time
-from collections import Counter
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Sequence
+
+from ._cache import DirCache
+from ._common import Progress, human_readable_size
+from ._walk import DEFAULT_JOBS, Prune, ScanResult, SubDir, scan_dir, walk
 
 DIR_KEY = "DIR"
 NUL_KEY = "NULL"
 
+# (offset, magic number) -> type, for --sniff
+MAGIC: dict[tuple[int, bytes], str] = {
+    (0, b"\x89PNG\r\n\x1a\n"): ".png",
+    (0, b"\xff\xd8\xff"): ".jpg",
+    (0, b"GIF87a"): ".gif",
+    (0, b"GIF89a"): ".gif",
+    (0, b"II*\x00"): ".tif",
+    (0, b"MM\x00*"): ".tif",
+    (8, b"WEBP"): ".webp",
+    (4, b"ftypheic"): ".heic",
+    (4, b"ftypqt  "): ".mov",
+    (4, b"ftyp"): ".mp4",
+    (0, b"\x1aE\xdf\xa3"): ".mkv",
+    (8, b"AVI "): ".avi",
+    (8, b"WAVE"): ".wav",
+    (0, b"ID3"): ".mp3",
+    (0, b"fLaC"): ".flac",
+    (0, b"OggS"): ".ogg",
+    (0, b"%PDF-"): ".pdf",
+    (0, b"PK\x03\x04"): ".zip",
+    (0, b"PK\x05\x06"): ".zip",
+    (0, b"\x1f\x8b"): ".gz",
+    (0, b"BZh"): ".bz2",
+    (0, b"\xfd7zXZ\x00"): ".xz",
+    (0, b"(\xb5/\xfd"): ".zst",
+    (0, b"7z\xbc\xaf'\x1c"): ".7z",
+    (0, b"Rar!\x1a\x07"): ".rar",
+    (0, b"SQLite format 3\x00"): ".sqlite",
+    (0, b"\x7fELF"): ".elf",
+    (0, b"MZ"): ".exe",
+    (0, b"\xcf\xfa\xed\xfe"): ".macho",
+    (0, b"\xca\xfe\xba\xbe"): ".class",
+    (0, b"\x00asm"): ".wasm",
+    (0, b"#!"): "#!",
+}
+
+
+def _magic_tables(
+    magic: dict[tuple[int, bytes], str],
+) -> list[tuple[int, int, dict[bytes, str]]]:
+    """group `magic` by (offset, length), longest first"""
+    tables: dict[tuple[int, int], dict[bytes, str]] = defaultdict(dict)
+    for (offset, prefix), kind in magic.items():
+        tables[offset, len(prefix)][prefix] = kind
+    return sorted(
+        ((off, n, table) for (off, n), table in tables.items()), key=lambda x: -x[1]
+    )
+
+
+# one dict lookup per (offset, length) instead of a comparison per magic
+_MAGIC_TABLES = _magic_tables(MAGIC)
+SNIFF_SIZE = max(off + len(prefix) for off, prefix in MAGIC)
+
 
 def get_ext(name: str) -> str:
     """what do special filenames return?
@@ -27,57 +89,254 @@ def get_ext(name: str) -> str:
     return suffix.lower() or NUL_KEY
 
 
-def count_root(root: tuple[str, list[str], list[str]]) -> tuple[Counter[str], int]:
-    _, d, f = root
-    ld = len(d)
-    counter = Counter({DIR_KEY: ld})
-    counter.update(Counter(map(get_ext, f)))
-    return counter, ld + len(f)
+def magic_type(path: str) -> str | None:
+    """type of a file by the magic number in its first SNIFF_SIZE bytes"""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        head = os.read(fd, SNIFF_SIZE)
+    finally:
+        os.close(fd)
+    for offset, length, table in _MAGIC_TABLES:
+        kind = table.get(head[offset : offset + length])
+        if kind is not None:
+            return kind
+    return None
+
+
+def count_root(
+    root: ScanResult,
+    counter: Counter[str],
+    sizes: Counter[str] | None = None,
+    sniff: bool = False,
+) -> int:
+    """add the entries of `root` to `counter` in place, and the bytes of its
+    files to `sizes` if given; return the number of entries
+
+    With `sniff`, regular files are typed by `magic_type` if it knows them."""
+    counter[DIR_KEY] += len(root.dirs)
+    for entry in root.files:
+        ext = None
+        if sniff and entry.is_file(follow_symlinks=False):
+            try:
+                ext = magic_type(entry.path)
+            except OSError:
+                pass
+        if ext is None:
+            ext = get_ext(entry.name)
+        counter[ext] += 1
+        if sizes is not None:
+            try:
+                sizes[ext] += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return len(root.dirs) + len(root.files)
+
+
+def _jsonl(record: dict) -> None:
+    sys.stdout.write(json.dumps(record) + "\n")
 
 
-def list_types(directory: str, recursive: bool) -> tuple[Counter[str], int]:
-    walker = os.walk(directory)
-    counter, count = count_root(next(walker))
+@dataclass(slots=True)
+class TypesResult(ScanResult):
+    """a listing along with the counts of the directory alone"""
 
-    if recursive:
+    types: Counter[str] = field(default_factory=Counter)
+    sizes: Counter[str] = field(default_factory=Counter)
+
+
+def scan_types(
+    path: str,
+    depth: int,
+    size: bool = False,
+    prune: Prune | None = None,
+    cache: DirCache | None = None,
+    kind: str = "",
+    sniff: bool = False,
+) -> TypesResult:
+    """List and count one directory, or take both from `cache` while the
+    directory's mtime is unchanged.
+
+    The mtime changes when entries are added, removed or renamed, not when a
+    file is rewritten in place, so cached sizes can lag behind. With
+    gitignore pruning, the versions of the .gitignore files that apply are
+    part of the key, as editing one changes no directory mtime."""
+    st, key = None, ""
+    if cache is not None:
         try:
-            for ctr, c in map(count_root, walker):
-                sys.stdout.write(f"\rcounting {count}")
-                counter += ctr
-                count += c
-        except KeyboardInterrupt:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
             pass
-        finally:
-            sys.stdout.write("\r")
+        else:
+            key = os.path.abspath(path)
+            if prune is not None and prune.gitignore:
+                kind = f"{kind}|{prune.stamp(path)}"
+            hit = cache.get(kind, key, st)
+            if hit is not None:
+                dirs = [SubDir(os.path.join(path, n), n) for n in hit["dirs"]]
+                return TypesResult(
+                    path,
+                    depth,
+                    dirs,  # type: ignore
+                    st=st,
+                    reused=True,
+                    types=Counter(hit["types"]),
+                    sizes=Counter(hit["sizes"]),
+                )
+
+    root = scan_dir(path, depth, stat=size, prune=prune)
+    result = TypesResult(path, depth, root.dirs, root.files, root.error, root.st)
+    count_root(root, result.types, result.sizes if size else None, sniff)
+    if cache is not None and st is not None and root.error is None:
+        value = {
+            "types": result.types,
+            "sizes": result.sizes,
+            "dirs": [d.name for d in root.dirs],
+        }
+        cache.put(kind, key, st, value)
+    return result
+
+
+def list_types(
+    directory: str,
+    recursive: bool,
+    jsonl: bool = False,
+    jobs: int = 1,
+    size: bool = False,
+    prune: Prune | None = None,
+    cache: DirCache | None = None,
+    sniff: bool = False,
+) -> tuple[Counter[str], Counter[str], int]:
+    """return the count and bytes per extension, and the number of entries
+
+    Directories are listed and counted on `jobs` threads, each into its own
+    counters, which are merged at the end. Bytes are only summed with `size`.
+    With `jsonl`, a JSON record is written per directory instead of the
+    progress. Entries matched by `prune` are skipped. With `cache`, the
+    counts of directories unchanged since the last run are reused.
+    With `sniff`, files are typed by magic number, read on the same threads."""
+    progress = Progress()
+    progress.enabled &= not jsonl
+    counter: Counter[str] = Counter({DIR_KEY: 0})
+    sizes: Counter[str] = Counter()
+    count = 0
+
+    # counts per directory are needed to print or cache them
+    per_dir = jsonl or cache is not None
+    kind = json.dumps(
+        {
+            "size": size,
+            "sniff": sniff,
+            "exclude": prune.exclude if prune else [],
+            "gitignore": prune.gitignore if prune else False,
+        }
+    )
+    local = threading.local()
+    tallies: list[tuple[Counter[str], Counter[str]]] = []
+
+    def scan(path: str, depth: int) -> ScanResult:
+        if per_dir:
+            return scan_types(path, depth, size, prune, cache, kind, sniff)
+        root = scan_dir(path, depth, stat=size, prune=prune)
+        try:
+            ctr, szs = local.tally
+        except AttributeError:
+            ctr, szs = local.tally = (Counter(), Counter())
+            tallies.append(local.tally)
+        count_root(root, ctr, szs if size else None, sniff)
+        return root
+
+    try:
+        for root in walk(directory, recursive, jobs=jobs, scan=scan):
+            if isinstance(root, TypesResult):
+                count += root.types.total()
+                counter.update(root.types)
+                sizes.update(root.sizes)
+            else:
+                count += len(root.dirs) + len(root.files)
+            if jsonl:
+                assert isinstance(root, TypesResult)
+                record = {"type": "dir", "path": root.path, "types": root.types}
+                if size:
+                    record["sizes"] = root.sizes
+                _jsonl(record)
+            else:
+                progress.update(count, f"counting {count}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        progress.clear()
 
-    return counter, count
+    for ctr, szs in tallies:
+        counter.update(ctr)
+        sizes.update(szs)
+    return counter, sizes, count
 
 
-def pprint(counter: Counter, count: int):
+def pprint(counter: Counter, count: int, sizes: Counter | None = None):
+    """With `sizes`, a column of bytes is added and types sort by it."""
     count_DIR = counter.pop(DIR_KEY)
     count_FILE = count - count_DIR
 
-    ret = sorted(counter.items(), key=lambda x: x[1])
+    if sizes:
+        ret = sorted(counter.items(), key=lambda x: sizes[x[0]])
+    else:
+        ret = sorted(counter.items(), key=lambda x: x[1])
     if len(ret) == 0:
         SPAN_WIDTH = 0
     else:
-        SPAN_WIDTH = math.ceil(math.log10(ret[-1][1] + 1))
+        SPAN_WIDTH = math.ceil(math.log10(max(counter.values()) + 1))
     print("-" * (SPAN_WIDTH + 18))  # + length of `counting `
     for e, c in ret:
-        print(f"    {c:>{SPAN_WIDTH}d}  {e}")
+        if sizes:
+            print(f"    {c:>{SPAN_WIDTH}d}  {human_readable_size(sizes[e]):>10}  {e}")
+        else:
+            print(f"    {c:>{SPAN_WIDTH}d}  {e}")
 
     print(f"\n  {count_FILE} file(s)  {count_DIR} dir(s)    {count:,} total")
+    if sizes:
+        print(f"  {human_readable_size(sizes.total())} in files")
 
 
-def run(directory: str, recursive: bool):
+def run(
+    directory: str,
+    recursive: bool,
+    jsonl: bool = False,
+    jobs: int = 1,
+    size: bool = False,
+    exclude: Sequence[str] = (),
+    gitignore: bool = False,
+    use_cache: bool = False,
+    sniff: bool = False,
+):
     if not os.path.isdir(directory):
         print(f"not a dir: {directory}")
         return
 
-    print(directory)
+    prune = Prune(directory, exclude, gitignore) if exclude or gitignore else None
+
+    if not jsonl:
+        print(directory)
     begin = time.perf_counter()
-    counter, count = list_types(directory, recursive)
-    pprint(counter, count)
+    with DirCache() if use_cache else nullcontext() as cache:
+        counter, sizes, count = list_types(
+            directory, recursive, jsonl, jobs, size, prune, cache, sniff
+        )
+    if jsonl:
+        count_dir = counter.pop(DIR_KEY)
+        summary = {
+            "type": "summary",
+            "path": directory,
+            "files": count - count_dir,
+            "dirs": count_dir,
+            "total": count,
+            "types": dict(counter.most_common()),
+            "seconds": round(time.perf_counter() - begin, 3),
+        }
+        if size:
+            summary["sizes"] = dict(sizes.most_common())
+        _jsonl(summary)
+        return
+    pprint(counter, count, sizes if size else None)
     print(f" cost time: {time.perf_counter() - begin:.3f}s")
 
 
@@ -98,11 +357,70 @@ def main():
         action="store_true",
         help="recursive",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"number of directories to list in parallel, default: {DEFAULT_JOBS}",
+    )
+    parser.add_argument(
+        "-s",
+        "--size",
+        action="store_true",
+        help="show the total bytes of each type and sort by it",
+    )
+    parser.add_argument(
+        "--sniff",
+        action="store_true",
+        help="type files by their magic number if known, not only their name",
+    )
+    parser.add_argument(
+        "--exclude",
+        metavar="PATTERN",
+        action="append",
+        default=[],
+        help="skip entries matching the glob PATTERN, can be repeated",
+    )
+    parser.add_argument(
+        "--gitignore",
+        action="store_true",
+        help="skip .git and entries ignored by .gitignore files",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse the counts of directories unchanged since the last run",
+    )
+    parser.add_argument(
+        "--json",
+        "--jsonl",
+        dest="jsonl",
+        action="store_true",
+        help="print a JSON line per directory and a summary line, no progress",
+    )
     args = parser.parse_args()
     # print(args)
     # return
 
     args_dir: str = args.dir
     args_r: bool = args.recursive
+    args_jobs: int = args.jobs
+    args_size: bool = args.size
+    args_jsonl: bool = args.jsonl
+    args_exclude: list[str] = args.exclude
+    args_gitignore: bool = args.gitignore
+    args_cache: bool = args.cache
+    args_sniff: bool = args.sniff
 
-    run(args_dir, args_r)
+    run(
+        args_dir,
+        args_r,
+        args_jsonl,
+        args_jobs,
+        args_size,
+        args_exclude,
+        args_gitignore,
+        args_cache,
+        args_sniff,
+    )
@@ -2,15 +2,17 @@
 """rename file or directory with some pattern"""
 
 import argparse
-import hashlib
 import random
 import re
 import string
+from contextlib import nullcontext
 from enum import StrEnum
 from pathlib import Path
 from typing import Callable, Sequence
 
+from ._cache import DigestCache
 from ._common import glob_paths
+from .hashsum import hash_file
 
 type RenameFunc = Callable[[Path], Path]
 
@@ -58,7 +60,7 @@ class ToWhat(StrEnum):
     NO_EXT = "no-ext"
 
 
-def dispatch(arg: ToWhat | str) -> RenameFunc:
+def dispatch(arg: ToWhat | str, cache: DigestCache | None = None) -> RenameFunc:
     try:
         arg = ToWhat(arg)
     except ValueError:
@@ -81,10 +83,8 @@ def dispatch(arg: ToWhat | str) -> RenameFunc:
         case t.MD5 | t.SHA1 | t.SHA256:
 
             def f(path: Path) -> Path:
-                with path.open("rb") as fp:
-                    hashsum = hashlib.file_digest(fp, arg)
-
-                return path.with_stem(hashsum.hexdigest())
+                hash_line = hash_file(arg, str(path), cache)
+                return path.with_stem(hash_line.digest)
 
         case t.NO_EXT:
 
@@ -111,6 +111,12 @@ def main():
         help=" | ".join(m.value for m in ToWhat) + " | s/str/repl/",
     )
     parser.add_argument("--dry-run", action="store_true", default=False)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=False,
+        help="reuse md5/sha* digests of unchanged files",
+    )
 
     # filter
     filters = parser.add_mutually_exclusive_group()
@@ -125,32 +131,34 @@ def main():
     dry_run: bool = args.dry_run
     only_file: bool = args.only_file
     only_dir: bool = args.only_dir
+    use_cache: bool = args.cache
 
-    try:
-        rename_func = dispatch(arg_to)
-    except ValueError as e:
-        print(f"[ERROR] {e}")
-        return
-
-    # get path list
-    paths = glob_paths(arg_path, only_file=only_file, only_dir=only_dir)
-    paths = map(Path, paths)
-
-    for path in paths:
-        try:
-            new_path = rename_func(path)
-        except Exception as e:
-            print(f"[ERROR] {e}")
-            continue
-
-        if dry_run:
-            print(f"[DRY-RUN] {path} -> {new_path}")
-            continue
-
+    with DigestCache() if use_cache else nullcontext() as cache:
         try:
-            # rename even if be the same
-            path.rename(new_path)
-        except OSError as e:
+            rename_func = dispatch(arg_to, cache)
+        except ValueError as e:
             print(f"[ERROR] {e}")
-        else:
-            print(f"[DONE] {path} -> {new_path}")
+            return
+
+        # get path list
+        paths = glob_paths(arg_path, only_file=only_file, only_dir=only_dir)
+        paths = map(Path, paths)
+
+        for path in paths:
+            try:
+                new_path = rename_func(path)
+            except Exception as e:
+                print(f"[ERROR] {e}")
+                continue
+
+            if dry_run:
+                print(f"[DRY-RUN] {path} -> {new_path}")
+                continue
+
+            try:
+                # rename even if be the same
+                path.rename(new_path)
+            except OSError as e:
+                print(f"[ERROR] {e}")
+            else:
+                print(f"[DONE] {path} -> {new_path}")
@@ -0,0 +1,48 @@
+import io
+
+from py_tools import _common
+from py_tools._common import Progress
+
+
+class FakeTTY(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_progress(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(_common.time, "perf_counter", lambda: now[0])
+
+    out = FakeTTY()
+    progress = Progress(interval=0.5, file=out)
+    now[0] += 1.0
+    progress.update(10, "ten")
+    assert out.getvalue() == "\rten  [10/s, 1.0s]"
+
+    # throttled until the interval has passed
+    now[0] += 0.2
+    progress.update(20, "twenty")
+    assert out.getvalue().count("\r") == 1
+    now[0] += 0.3
+    progress.update(45, "longer text")
+    assert out.getvalue().endswith("\rlonger text  [30/s, 1.5s]")
+
+    # shorter lines pad over the previous one, clear erases it
+    now[0] += 0.5
+    progress.update(40, "x")
+    line = out.getvalue().rsplit("\r", 1)[1]
+    assert line == f"{'x  [20/s, 2.0s]':<{len('longer text  [30/s, 1.5s]')}}"
+    progress.clear()
+    assert out.getvalue().endswith(f"\r{' ' * len('x  [20/s, 2.0s]')}\r")
+    written = out.getvalue()
+    progress.clear()
+    assert out.getvalue() == written
+
+
+def test_progress_not_tty():
+    out = io.StringIO()
+    progress = Progress(interval=0, file=out)
+    assert not progress.enabled
+    progress.update(1, "one")
+    progress.clear()
+    assert out.getvalue() == ""
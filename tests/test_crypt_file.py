@@ -1,14 +1,28 @@
+import os
+import random
 from hashlib import file_digest, sha256
+from itertools import cycle, starmap
+from operator import xor
 from pathlib import Path
 
 import pytest
 
+from py_tools import crypt_file
 from py_tools.crypt_file import (
+    CHUNK_SIZE,
+    Journal,
     MyBase64,
     _get_encrypt_name,
     _parse_encrypt_name,
+    _replace_file_head,
+    _xor_bytes,
+    apply_entry,
+    crypt_files,
     decrypt_file,
     encrypt_file,
+    get_base64,
+    plan_file,
+    recover,
 )
 
 
@@ -24,6 +38,24 @@ def test_MyBase64():
         assert my_base64.decode(encoded) == data
 
 
+def test_get_base64():
+    state = random.getstate()
+    b64 = get_base64("seed")
+    assert random.getstate() == state
+    assert get_base64("seed") is b64
+    assert get_base64("other") is not b64
+    assert b64.encode(b"ABCDEFG") == MyBase64("seed").encode(b"ABCDEFG")
+
+
+def test_xor_bytes():
+    for n in (0, 1, 7, 8, 4096, 4099):
+        data = os.urandom(n)
+        for key in (b"k", b"key", b"\x00\xffkey\x00"):
+            expected = bytes(starmap(xor, zip(data, cycle(key))))
+            assert _xor_bytes(data, key) == expected
+            assert _xor_bytes(expected, key) == data
+
+
 def test_x_encrypt_name():
     B64 = MyBase64("seed")
     NAME = "ABCDEFG"
@@ -68,3 +100,252 @@ def test_real():
         assert new_hash == old_hash
 
     assert count > 0
+
+
+def test_crypt_files(tmp_path):
+    b64 = MyBase64("random-seed")
+    datas = {f"f{i}.bin": os.urandom(i * 1000) for i in range(6)}
+    for name, data in datas.items():
+        (tmp_path / name).write_bytes(data)
+    journal = Journal(str(tmp_path / "journal"))
+
+    paths = sorted(tmp_path.glob("*.bin"))
+    results = list(crypt_files(paths, b64, journal, jobs=4))
+    assert not journal.exists()
+    assert [old for old, _ in results] == [str(p) for p in paths]
+    encrypted = [new for _, new in results]
+    assert not any(p.exists() for p in paths)
+
+    list(crypt_files(encrypted, b64, journal, decrypt=True, jobs=4))
+    for name, data in datas.items():
+        assert (tmp_path / name).read_bytes() == data
+
+
+def test_recover(tmp_path):
+    b64 = MyBase64("random-seed")
+    datas = {f"f{i}.bin": os.urandom(5000) for i in range(3)}
+    for name, data in datas.items():
+        (tmp_path / name).write_bytes(data)
+
+    def crash(journal):
+        # one file done, one XORed but not renamed, one untouched
+        entries = [plan_file(tmp_path / name, b64) for name in datas]
+        journal.append(entries)
+        journal.close()
+        apply_entry(entries[0])
+        _replace_file_head(Path(entries[1].old), entries[1].key.encode())
+        return entries
+
+    journal = Journal(str(tmp_path / "journal"))
+    entries = crash(journal)
+    results = list(recover(journal, rollback=True))
+    assert not journal.exists()
+    assert [str(new) for _, new in results] == [e.old for e in reversed(entries)]
+    for name, data in datas.items():
+        assert (tmp_path / name).read_bytes() == data
+
+    entries = crash(journal)
+    list(recover(journal))
+    assert not journal.exists()
+    for entry in entries:
+        assert not os.path.exists(entry.old)
+        decrypt_file(Path(entry.new), b64)
+    for name, data in datas.items():
+        assert (tmp_path / name).read_bytes() == data
+
+
+def test_head_size(tmp_path):
+    b64 = MyBase64("random-seed")
+    data = os.urandom(CHUNK_SIZE * 2 + 12345)
+    path = tmp_path / "video.mp4"
+
+    for size in (10_000, CHUNK_SIZE + 1, None):
+        path.write_bytes(data)
+        new_path = encrypt_file(path, b64, size)
+        assert new_path is not None
+        _, key = _parse_encrypt_name(new_path.name, b64=b64)
+        n = len(data) if size is None else size
+        expected = _xor_bytes(data[:n], key) + data[n:]
+        assert new_path.read_bytes() == expected
+
+        assert decrypt_file(new_path, b64, size) == path
+        assert path.read_bytes() == data
+
+
+def test_large_head_recover(tmp_path, monkeypatch):
+    monkeypatch.setattr(crypt_file, "CHECKPOINT_CHUNKS", 2)
+    b64 = MyBase64("random-seed")
+    # 6 chunks, in 3 spans of 2
+    data = os.urandom(CHUNK_SIZE * 5 + 12345)
+    path = tmp_path / "video.mp4"
+    journal = Journal(str(tmp_path / "journal"))
+    read_chunk = crypt_file._read_chunk
+
+    def crash_after(n):
+        """interrupt at the n-th chunk read, 4 per span: 2 to checkpoint, 2
+        to write"""
+        calls = iter(range(n - 1))
+
+        def wrapper(*args):
+            if next(calls, None) is None:
+                raise KeyboardInterrupt
+            return read_chunk(*args)
+
+        monkeypatch.setattr(crypt_file, "_read_chunk", wrapper)
+
+    # crash at read n, then at read m recovering the other way
+    cases = [
+        (1, False, None),
+        (4, True, 2),
+        (7, True, 3),
+        (12, False, 6),
+        (7, False, 6),
+    ]
+    for n, rollback, m in cases:
+        path.write_bytes(data)
+        crash_after(n)
+        with pytest.raises(KeyboardInterrupt):
+            list(crypt_files([path], b64, journal, size=None))
+        if m is not None:
+            crash_after(m)
+            with pytest.raises(KeyboardInterrupt):
+                list(recover(journal, rollback=not rollback))
+        monkeypatch.setattr(crypt_file, "_read_chunk", read_chunk)
+
+        results = list(recover(journal, rollback=rollback))
+        assert all(not isinstance(new, Exception) for _, new in results)
+        assert not journal.exists()
+        if not rollback:
+            [new_path] = tmp_path.iterdir()
+            assert decrypt_file(new_path, b64, None) == path
+        assert path.read_bytes() == data
+
+
+def test_recursive(tmp_path, monkeypatch):
+    b64 = MyBase64("random-seed")
+    top = tmp_path / "top"
+    tree = {"a/b/c/x": b"x" * 5000, "a/y": b"y", "a/b/e/z": b"z", "w": b""}
+    for name, data in tree.items():
+        (top / name).parent.mkdir(parents=True, exist_ok=True)
+        (top / name).write_bytes(data)
+
+    def read_tree():
+        return {
+            p.relative_to(top).as_posix(): p.read_bytes()
+            for p in top.rglob("*")
+            if p.is_file()
+        }
+
+    journal = Journal(str(tmp_path / "journal"))
+    results = list(crypt_files([top], b64, journal, jobs=4, recursive=True))
+    assert len(results) == 8 and not journal.exists()
+    names = {p.name for p in top.rglob("*")}
+    assert not names & {"a", "b", "c", "e", "w", "x", "y", "z"}
+
+    list(crypt_files([top], b64, journal, decrypt=True, jobs=4, recursive=True))
+    assert read_tree() == tree
+
+    # roll back a whole run from its journal
+    monkeypatch.setattr(journal, "rewrite", lambda entries: journal.close())
+    list(crypt_files([top], b64, journal, jobs=4, recursive=True))
+    monkeypatch.undo()
+    assert journal.exists()
+    list(recover(journal, rollback=True, jobs=4))
+    assert not journal.exists()
+    assert read_tree() == tree
+
+    # resume a run interrupted in a directory stage: files under renamed
+    # directories are done, not missing
+    results = crypt_files([top], b64, journal, jobs=1, recursive=True)
+    for _, new in results:
+        if new.is_dir():
+            break
+    results.close()
+    assert journal.exists()
+    results = list(recover(journal, jobs=4))
+    assert all(not isinstance(new, Exception) for _, new in results)
+    assert not journal.exists()
+    list(crypt_files([top], b64, journal, decrypt=True, jobs=4, recursive=True))
+    assert read_tree() == tree
+
+
+def test_crypt_files_duplicates(tmp_path):
+    b64 = MyBase64("random-seed")
+    data = os.urandom(5000)
+    path = tmp_path / "a.jpg"
+    path.write_bytes(data)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub/b.jpg").write_bytes(data)
+    os.symlink(path, tmp_path / "link.jpg")
+    journal = Journal(str(tmp_path / "journal"))
+
+    paths = [path, path, tmp_path / "link.jpg", path]
+    results = list(crypt_files(paths, b64, journal, jobs=4))
+    assert [old for old, _ in results] == [str(path)]
+    [(_, new_path)] = results
+    assert decrypt_file(new_path, b64) == path
+    assert path.read_bytes() == data
+
+    tops = [tmp_path / "sub", tmp_path]
+    results = list(crypt_files(tops, b64, journal, jobs=4, recursive=True))
+    # a.jpg, sub/b.jpg once each and the sub directory, the walk skips
+    # symlinks
+    assert len(results) == 3
+    assert all(not isinstance(new, Exception) for _, new in results)
+    list(crypt_files([tmp_path], b64, journal, decrypt=True, jobs=4, recursive=True))
+    assert path.read_bytes() == data
+    assert (tmp_path / "sub/b.jpg").read_bytes() == data
+
+
+def test_crypt_files_dir(tmp_path):
+    b64 = MyBase64("random-seed")
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    (sub / "x").write_bytes(b"x")
+    journal = Journal(str(tmp_path / "journal"))
+
+    [(old, error)] = list(crypt_files([sub], b64, journal))
+    assert old == str(sub) and isinstance(error, IsADirectoryError)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["sub"]
+    assert (sub / "x").read_bytes() == b"x"
+
+
+def test_crypt_files_failed(tmp_path, monkeypatch):
+    b64 = MyBase64("random-seed")
+    datas = {f"f{i}.bin": os.urandom(5000) for i in range(3)}
+    for name, data in datas.items():
+        (tmp_path / name).write_bytes(data)
+    paths = [tmp_path / name for name in datas]
+    journal = Journal(str(tmp_path / "journal"))
+
+    renamed = set()
+
+    def failing_apply(entry, rollback=False, journal=None):
+        if entry.old == str(paths[0]):
+            # fails before touching the file, like a read-only one
+            raise PermissionError(entry.old)
+        if entry.old == str(paths[1]) and entry.old not in renamed:
+            # XORed, but the rename fails once
+            renamed.add(entry.old)
+            _replace_file_head(Path(entry.old), entry.key.encode())
+            raise PermissionError(entry.old)
+        return apply_entry(entry, rollback, journal)
+
+    monkeypatch.setattr(crypt_file, "apply_entry", failing_apply)
+    results = list(crypt_files(paths, b64, journal, jobs=4))
+    assert [isinstance(new, Exception) for _, new in results] == [True, True, False]
+    # only the half-done file is left to recover
+    [entry] = journal.read()
+    assert entry.old == str(paths[1])
+    assert paths[0].read_bytes() == datas["f0.bin"]
+
+    # --resume reports and drops an entry that still fails on an untouched
+    # file, and finishes the half-done one
+    journal.append([plan_file(paths[0], b64)])
+    journal.close()
+    results = list(recover(journal))
+    assert [isinstance(new, Exception) for _, new in results] == [False, True]
+    assert not journal.exists()
+    assert paths[0].read_bytes() == datas["f0.bin"]
+    assert decrypt_file(Path(entry.new), b64) == paths[1]
+    assert paths[1].read_bytes() == datas["f1.bin"]
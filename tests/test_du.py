@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from py_tools.du import (
+    HAS_BLOCKS,
+    Breakdown,
+    DirRecord,
+    InodeSet,
+    count,
+    load_snapshot,
+    run,
+    save_snapshot,
+)
+
+
+def make_tree(root):
+    for path, size in [
+        ("a/x", 10),
+        ("a/b/y", 20),
+        ("a/b/c/z", 30),
+        ("d/w", 5),
+        ("v", 1),
+    ]:
+        path = root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(bytes(size))
+
+
+def test_count(tmp_path):
+    make_tree(tmp_path)
+    os.link(tmp_path / "a/x", tmp_path / "d/x-link")
+
+    for jobs in (1, 4):
+        items = [item[:3] for _, item, _ in count(str(tmp_path), True, jobs)]
+        assert tuple(map(sum, zip(*items))) == (4, 5, 66)
+
+    items = [item[:3] for _, item, _ in count(str(tmp_path), False)]
+    assert items == [(2, 1, 1)]
+
+
+def test_count_symlinks(tmp_path):
+    make_tree(tmp_path)
+    os.link(tmp_path / "a/b/y", tmp_path / "d/y-link")
+    os.link(tmp_path / "a/b/y", tmp_path / "a/b/c/y-link")
+    # symlinks are counted as themselves, never followed
+    os.symlink(tmp_path / "a", tmp_path / "d/a-link")
+    os.symlink("../v", tmp_path / "d/v-link")
+    links = len(str(tmp_path / "a")) + len("../v")
+
+    for jobs in (1, 2, 8):
+        results = list(count(str(tmp_path), True, jobs))
+        assert str(tmp_path) == results[0][0].path
+        paths = sorted(os.path.relpath(root.path, tmp_path) for root, *_ in results)
+        assert paths == [".", "a", "a/b", "a/b/c", "d"]
+        items = [item[:3] for _, item, _ in results]
+        assert tuple(map(sum, zip(*items))) == (4, 7, 66 + links)
+
+
+@pytest.mark.skipif(not HAS_BLOCKS, reason="no st_blocks")
+def test_count_sparse(tmp_path):
+    with open(tmp_path / "sparse", "wb") as fp:
+        fp.truncate(1 << 30)
+    (tmp_path / "dense").write_bytes(os.urandom(1 << 16))
+
+    [(_, (_, nf, ns, na, nsp), _)] = count(str(tmp_path), False)
+    assert (nf, ns, nsp) == (2, (1 << 30) + (1 << 16), 1)
+    assert (1 << 16) <= na < 1 << 20
+
+
+def test_breakdown(tmp_path):
+    make_tree(tmp_path)
+    top = str(tmp_path)
+
+    for max_depth, expected in [
+        (1, [("a", 60), ("d", 5)]),
+        (2, [("a", 60), ("a/b", 50), ("d", 5)]),
+        (9, [("a", 60), ("a/b", 50), ("a/b/c", 30), ("d", 5)]),
+    ]:
+        breakdown = Breakdown(top, max_depth)
+        for root, (_, _, size, _, _), _ in count(top, True):
+            breakdown.add(root.path, size)
+        expected = [(os.path.join(top, p), s) for p, s in expected]
+        assert breakdown.largest(9) == expected
+        assert breakdown.largest(1) == expected[:1]
+
+
+def test_inode_set(monkeypatch):
+    monkeypatch.setattr(InodeSet, "MIN_BUFFER", 3)
+    inodes = InodeSet()
+    keys = [(dev, ino) for ino in range(100, 0, -7) for dev in (1, 2)]
+    for key in keys:
+        assert inodes.add(key)
+    for key in keys:
+        assert key in inodes
+        assert not inodes.add(key)
+    assert len(inodes) == len(keys)
+    assert (3, 100) not in inodes
+    assert (1, 99) not in inodes
+
+
+def test_snapshot(tmp_path):
+    make_tree(tmp_path / "top")
+    top = str(tmp_path / "top")
+    file = str(tmp_path / "snapshot.jsonl")
+
+    save_snapshot(file, (DirRecord.of(top, *x) for x in count(top, True)))
+    snapshot = load_snapshot(file)
+    assert sorted(snapshot) == ["", "a", "a/b", "a/b/c", "d"]
+    assert snapshot["a"].subdirs == ["b"]
+
+    # only the changed directory is listed again
+    os.remove(os.path.join(top, "d/w"))
+    for jobs in (1, 4):
+        reused, total = {}, 0
+        for root, (_, _, size, _, _), _ in count(top, True, jobs, snapshot):
+            reused[os.path.relpath(root.path, top)] = root.reused
+            total += size
+        assert reused == {".": True, "a": True, "a/b": True, "a/b/c": True, "d": False}
+        assert total == 61
+
+
+def test_snapshot_links(tmp_path):
+    make_tree(tmp_path / "top")
+    top = str(tmp_path / "top")
+    file = str(tmp_path / "snapshot.jsonl")
+    os.link(os.path.join(top, "a/x"), os.path.join(top, "d/x"))
+
+    save_snapshot(file, (DirRecord.of(top, *x) for x in count(top, True)))
+    snapshot = load_snapshot(file)
+
+    # either copy of the link may be listed again while the other is reused
+    for changed in ("a", "d"):
+        path = os.path.join(top, changed, "new")
+        with open(path, "wb"):
+            pass
+        for jobs in (1, 4):
+            items = [item for _, item, _ in count(top, True, jobs, snapshot)]
+            assert sum(item[2] for item in items) == 66
+            assert sum(item[1] for item in items) == 6
+        os.remove(path)
+
+
+def test_run_jsonl(tmp_path, capsys):
+    make_tree(tmp_path / "top")
+    top = str(tmp_path / "top")
+    file = str(tmp_path / "snapshot.jsonl")
+
+    run(top, top_n=2, save=file, jsonl=True)
+    *dirs, summary = map(json.loads, capsys.readouterr().out.splitlines())
+    assert {d["type"] for d in dirs} == {"dir"}
+    assert sorted(os.path.relpath(d["path"], top) for d in dirs) == [
+        ".",
+        "a",
+        "a/b",
+        "a/b/c",
+        "d",
+    ]
+    assert sum(d["size"] for d in dirs) == 66
+    assert summary["type"] == "summary"
+    assert (summary["dirs"], summary["files"], summary["size"]) == (4, 5, 66)
+    top_dirs = [(os.path.relpath(p, top), s) for p, s in summary["top"]]
+    assert top_dirs == [("a", 60), ("d", 5)]
+    assert "size_delta" not in summary
+
+    (tmp_path / "top/d/new").write_bytes(bytes(100))
+    os.remove(tmp_path / "top/a/x")
+    run(top, top_n=2, since=file, jsonl=True)
+    summary = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert summary["size"] == 156
+    assert summary["size_delta"] == 90
+    deltas = [(os.path.relpath(p, top), d) for p, d in summary["top_deltas"]]
+    assert deltas == [("d", 100), ("a", -10)]
+
+
+def test_run_since_covered(tmp_path, capsys):
+    make_tree(tmp_path / "top")
+    top = str(tmp_path / "top")
+    file = str(tmp_path / "snapshot.jsonl")
+    run(top, save=file, jsonl=True)
+    capsys.readouterr()
+
+    def size_delta(**kwargs):
+        run(top, since=file, jsonl=True, **kwargs)
+        return json.loads(capsys.readouterr().out.splitlines()[-1])["size_delta"]
+
+    # a run over less of the tree compares with as much of the snapshot
+    assert size_delta() == 0
+    assert size_delta(recursive=False) == 0
+    assert size_delta(exclude=["b"]) == 0
+
+    shutil.rmtree(tmp_path / "top/a/b")
+    assert size_delta() == -50
+
+    (tmp_path / "bad.jsonl").write_text("[1, 2]\n")
+    for bad in ("bad.jsonl", "missing.jsonl"):
+        run(top, since=str(tmp_path / bad))
+        assert capsys.readouterr().out.startswith(f"[ERROR] bad snapshot {tmp_path}")
@@ -0,0 +1,35 @@
+import os
+
+from py_tools.dupes import PROBE_SIZE, find_dupes, hardlink
+
+
+def test_find_dupes(tmp_path):
+    big = os.urandom(3 * PROBE_SIZE)
+    # same size, head and tail, differ only in the middle
+    middle = bytearray(big)
+    middle[len(big) // 2] ^= 1
+    files = {
+        "a": b"small",
+        "b": b"small",
+        "c": b"smalL",
+        "d": big,
+        "e": big,
+        "f": bytes(middle),
+        "g": b"",
+        "h": b"",
+    }
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+    os.link(tmp_path / "a", tmp_path / "a-link")
+
+    paths = sorted(str(p) for p in tmp_path.iterdir())
+    for jobs in (1, 4):
+        groups = sorted(find_dupes(paths, jobs))
+        assert groups == [
+            (5, [str(tmp_path / "a"), str(tmp_path / "b")]),
+            (len(big), [str(tmp_path / "d"), str(tmp_path / "e")]),
+        ]
+
+    hardlink(str(tmp_path / "d"), str(tmp_path / "e"))
+    assert os.path.samefile(tmp_path / "d", tmp_path / "e")
+    assert find_dupes([str(tmp_path / "d"), str(tmp_path / "e")]) == []
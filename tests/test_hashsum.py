@@ -0,0 +1,273 @@
+import hashlib
+import io
+import os
+import stat
+
+from py_tools import hashsum
+from py_tools._cache import DigestCache
+from py_tools._common import read_names
+from py_tools.hashsum import (
+    CheckSummary,
+    HashLine,
+    UpdateSummary,
+    check_sum,
+    hash_file,
+    hash_file_algs,
+    hash_files,
+    update_manifest,
+)
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+
+    line = hash_file("sha256", str(path))
+    assert line == HashLine(hashlib.sha256(b"hello").hexdigest(), str(path))
+    assert str(line) == f"{line.digest}  {path}"
+
+
+def test_hash_files_order(tmp_path):
+    files = []
+    for i in range(50):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(bytes([i]) * (i * 1000))
+        files.append(str(path))
+
+    expected = [hash_file("md5", f) for f in files]
+    assert list(hash_files("md5", files)) == expected
+    assert list(hash_files("md5", files, jobs=4)) == expected
+    assert list(hash_files("md5", iter(files), jobs=4)) == expected
+
+
+def test_hash_file_cache(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+
+    with DigestCache(str(tmp_path / "cache.sqlite3")) as cache:
+        line = hash_file("md5", str(path), cache)
+        assert line == hash_file("md5", str(path))
+
+        # a fresh entry is served from the cache
+        st = path.stat()
+        cache.put("md5", st, "cached")
+        assert hash_file("md5", str(path), cache).digest == "cached"
+
+        # any change of size or mtime invalidates it
+        path.write_bytes(b"hello world")
+        assert hash_file("md5", str(path), cache) == hash_file("md5", str(path))
+
+
+def test_digest_cache_evict(tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"{i}.txt"
+        path.write_bytes(bytes(i))
+        paths.append(path)
+
+    with DigestCache(db, max_entries=3) as cache:
+        for path in paths:
+            hash_file("sha1", str(path), cache)
+
+    with DigestCache(db) as cache:
+        hits = [cache.get("sha1", path.stat()) for path in paths]
+    assert [h is not None for h in hits] == [False, False, True, True, True]
+
+
+def test_digest_cache_commit(tmp_path, monkeypatch):
+    db = str(tmp_path / "cache.sqlite3")
+    st = [(tmp_path / f"{i}.txt") for i in range(3)]
+    for path in st:
+        path.write_bytes(b"x")
+    st = [path.stat() for path in st]
+
+    first = DigestCache(db)
+    second = DigestCache(db)
+    # buffered writes and hits of one run don't lock out another
+    first.put("sha1", st[0], "a")
+    assert first.get("sha1", st[0]) == "a"
+    second.put("sha1", st[1], "b")
+    second.flush()
+    assert first.get("sha1", st[1]) == "b"
+
+    # committed every COMMIT_ROWS, without waiting for close
+    monkeypatch.setattr(DigestCache, "COMMIT_ROWS", 2)
+    first.put("sha1", st[2], "c")
+    assert second.get("sha1", st[0]) == "a"
+    first.close()
+    second.close()
+
+
+def test_check_sum(tmp_path, capsys):
+    good = tmp_path / "good.txt"
+    good.write_bytes(b"good")
+    bad = tmp_path / "bad file.txt"
+    bad.write_bytes(b"bad")
+
+    sums = tmp_path / "SUMS"
+    sums.write_text(
+        f"{hash_file('sha1', str(good))}\n"
+        f"{'0' * 40}  {bad}\n"
+        "malformed\n"
+        f"{'0' * 40}  {tmp_path / 'missing.txt'}\n"
+    )
+
+    summary = check_sum("sha1", str(sums), jobs=2)
+    assert summary == CheckSummary(ok=1, failed=1, missing=1, bad_lines=1, nbytes=7)
+    assert not summary.passed
+    assert capsys.readouterr().out.splitlines() == [
+        f"OK: {good}",
+        f"do NOT match: {bad}",
+        f"not found: {tmp_path / 'missing.txt'}",
+    ]
+
+    summary = check_sum("sha1", str(sums), fail_fast=True)
+    assert (summary.ok, summary.failed, summary.missing) == (1, 1, 0)
+
+
+def test_check_sum_cache(tmp_path, capsys):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"a")
+    sums = tmp_path / "SUMS"
+    sums.write_text(f"{hash_file('sha1', str(path))}\n")
+
+    with DigestCache(str(tmp_path / "cache.sqlite3")) as cache:
+        # a stale digest, as left by bitrot under the same size and mtime
+        st = path.stat()
+        cache.put("sha1", st, "0" * 40)
+        assert check_sum("sha1", str(sums), cache).passed
+        # the file is read, and the cache refreshed
+        assert cache.get("sha1", st) == hash_file("sha1", str(path)).digest
+
+        cache.put("sha1", st, hash_file("sha1", str(path)).digest)
+        path.write_bytes(b"b")
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert not check_sum("sha1", str(sums), cache).passed
+    capsys.readouterr()
+
+
+def test_hash_file_algs(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(bytes(range(256)) * 5000)
+
+    algs = ["md5", "sha256", "sha512"]
+    lines = hash_file_algs(algs, str(path))
+    assert lines == [hash_file(alg, str(path)) for alg in algs]
+    for alg, line in zip(algs, lines):
+        assert line.digest == hashlib.new(alg, path.read_bytes()).hexdigest()
+
+    with DigestCache(str(tmp_path / "cache.sqlite3")) as cache:
+        cache.put("md5", path.stat(), "cached")
+        lines = hash_file_algs(algs, str(path), cache)
+        assert lines[0].digest == "cached"
+        assert lines[1:] == [hash_file(alg, str(path)) for alg in algs[1:]]
+
+
+def test_read_strategy(tmp_path, monkeypatch):
+    path = tmp_path / "a.bin"
+    data = bytes(range(256)) * 4099
+    path.write_bytes(data)
+    expected = hashlib.sha1(data).hexdigest()
+
+    for block_size in (4093, 1 << 16, 1 << 22):
+        assert hash_file("sha1", str(path), block_size=block_size).digest == expected
+
+    monkeypatch.setattr(hashsum, "MMAP_THRESHOLD", 1)
+    for block_size in (1000, 1 << 22):
+        assert hash_file("sha1", str(path), block_size=block_size).digest == expected
+
+
+def test_read_names():
+    data = b"a b\0c\r\n\0\0d"
+    assert list(read_names(io.BytesIO(data), b"\0")) == ["a b", "c\r\n", "d"]
+    assert list(read_names(io.BytesIO(b"a\r\nb\n\nc"))) == ["a", "b", "c"]
+
+
+def test_names_from(tmp_path, capsys):
+    (tmp_path / "a").write_bytes(b"a")
+    names = tmp_path / "names"
+    names.write_bytes(b"\0".join(bytes(tmp_path / n) for n in ("a", "missing", "")))
+
+    missing = []
+    assert list(hashsum._names_from(str(names), b"\0", missing)) == [
+        str(tmp_path / "a")
+    ]
+    assert missing == [str(tmp_path / "missing"), str(tmp_path)]
+    assert capsys.readouterr().err.splitlines() == [
+        f"[ERROR] {tmp_path / 'missing'}: not a file",
+        f"[ERROR] {tmp_path}: not a file",
+    ]
+
+
+def test_update_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in "abc":
+        (tmp_path / name).write_text(name)
+
+    summary = update_manifest("md5", "SUMS", ["a", "b", "SUMS"])
+    assert summary == UpdateSummary(added=2)
+    old_sums = (tmp_path / "SUMS").read_text()
+    assert old_sums == f"{hash_file('md5', 'a')}\n{hash_file('md5', 'b')}\n"
+
+    # entries not touched since the manifest was written are not hashed again
+    os.utime("SUMS", ns=(1 << 62, 1 << 62))
+    (tmp_path / "a").unlink()
+    summary = update_manifest("md5", "SUMS", ["c"])
+    assert summary == UpdateSummary(added=1, removed=1, unchanged=1)
+    new_sums = (tmp_path / "SUMS").read_text()
+    assert new_sums == f"{hash_file('md5', 'b')}\n{hash_file('md5', 'c')}\n"
+
+    # changed files are hashed again
+    (tmp_path / "b").write_text("bb")
+    summary = update_manifest("md5", "SUMS")
+    assert summary == UpdateSummary(updated=1, unchanged=1)
+
+    # a file changed after it was hashed is hashed again next time
+    def hash_then_change(alg, path, **kwargs):
+        line = hash_file(alg, path, **kwargs)
+        (tmp_path / path).write_text("changed")
+        return line
+
+    (tmp_path / "b").write_text("bbb")
+    monkeypatch.setattr(hashsum, "hash_file", hash_then_change)
+    summary = update_manifest("md5", "SUMS")
+    assert summary == UpdateSummary(updated=1, unchanged=1)
+    monkeypatch.setattr(hashsum, "hash_file", hash_file)
+    summary = update_manifest("md5", "SUMS")
+    assert summary == UpdateSummary(updated=1, unchanged=1)
+    assert (tmp_path / "SUMS").read_text().startswith(hash_file("md5", "b").digest)
+
+
+def test_update_manifest_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a").write_text("a")
+    umask = os.umask(0o022)
+    try:
+        update_manifest("md5", "SUMS", ["a"])
+        assert stat.S_IMODE(os.stat("SUMS").st_mode) == 0o644
+        os.chmod("SUMS", 0o640)
+        update_manifest("md5", "SUMS", ["a"])
+        assert stat.S_IMODE(os.stat("SUMS").st_mode) == 0o640
+    finally:
+        os.umask(umask)
+
+
+def test_tree_digest(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashsum, "TREE_LEAF_SIZE", 1000)
+    for alg in hashsum.TREE_ALGS:
+        digests = set()
+        for size in (0, 1, 999, 1000, 1001, 5000, 12345):
+            path = tmp_path / f"{size}.bin"
+            data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+            path.write_bytes(data)
+
+            # memory-mapped, parallel leaves vs read leaf by leaf
+            line = hash_file(alg, str(path))
+            with path.open("rb") as fp:
+                assert line.digest == hashsum._tree_digest(fp, alg)
+
+            plain = alg.removesuffix(hashsum.TREE_SUFFIX)
+            assert line.digest != hash_file(plain, str(path)).digest
+            digests.add(line.digest)
+        assert len(digests) == 7
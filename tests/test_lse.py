@@ -0,0 +1,151 @@
+import json
+import os
+
+from py_tools import _walk, lse
+from py_tools._cache import DirCache
+from py_tools._walk import Ignore, Prune
+from py_tools.lse import DIR_KEY, NUL_KEY, list_types, magic_type
+
+
+def make_tree(root):
+    for path, size in [
+        ("a/x.txt", 10),
+        ("a/b/y.TXT", 20),
+        ("a/b/c/z.py", 30),
+        ("d/README", 5),
+        ("v.py", 1),
+    ]:
+        path = root / path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(bytes(size))
+
+
+def test_list_types(tmp_path):
+    make_tree(tmp_path)
+
+    for jobs in (1, 4):
+        counter, sizes, count = list_types(str(tmp_path), True, jobs=jobs, size=True)
+        assert counter == {DIR_KEY: 4, ".txt": 2, ".py": 2, NUL_KEY: 1}
+        assert sizes == {".txt": 30, ".py": 31, NUL_KEY: 5}
+        assert count == 9
+
+    counter, sizes, count = list_types(str(tmp_path), False)
+    assert counter == {DIR_KEY: 2, ".py": 1}
+    assert not sizes
+    assert count == 3
+
+
+def test_prune(tmp_path):
+    make_tree(tmp_path)
+    (tmp_path / ".git/objects").mkdir(parents=True)
+    (tmp_path / ".git/objects/o").write_bytes(b"")
+    (tmp_path / ".gitignore").write_text("# comment\n*.txt\n!keep.txt\n/d/\n")
+    (tmp_path / "a/b/.gitignore").write_text("c/\n")
+
+    prune = Prune(str(tmp_path), ["v.*"])
+    counter, _, _ = list_types(str(tmp_path), True, prune=prune)
+    assert counter == {DIR_KEY: 6, ".txt": 2, ".py": 1, NUL_KEY: 4}
+
+    for jobs in (1, 4):
+        prune = Prune(str(tmp_path) + os.sep, ["v.*"], gitignore=True)
+        counter, _, _ = list_types(str(tmp_path), True, jobs=jobs, prune=prune)
+        assert counter == {DIR_KEY: 2, NUL_KEY: 2, ".txt": 1}
+
+
+def test_ignore():
+    ignore = Ignore(["*.o", "build/", "/top", "doc/*.md", "a/**/z", "[!x]y"])
+    assert ignore.match("x.o", False)
+    assert ignore.match("sub/x.o", False)
+    assert ignore.match("sub/build", True)
+    assert not ignore.match("sub/build", False)
+    assert ignore.match("top", False)
+    assert not ignore.match("sub/top", False)
+    assert ignore.match("doc/x.md", False)
+    assert not ignore.match("doc/sub/x.md", False)
+    assert ignore.match("a/z", False)
+    assert ignore.match("a/b/c/z", False)
+    assert ignore.match("ay", False)
+    assert not ignore.match("xy", False)
+    assert not Ignore(["", "# comment", "!neg"])
+
+
+def test_cache(tmp_path, monkeypatch):
+    top = tmp_path / "top"
+    make_tree(top)
+    expected = {DIR_KEY: 4, ".txt": 2, ".py": 2, NUL_KEY: 1}
+
+    with DirCache(str(tmp_path / "dirs.sqlite3")) as cache:
+        counter, sizes, count = list_types(str(top), True, size=True, cache=cache)
+        assert counter == expected and count == 9
+
+        calls = []
+        scan_dir = _walk.scan_dir
+
+        def spy(path, *args, **kwargs):
+            calls.append(path)
+            return scan_dir(path, *args, **kwargs)
+
+        monkeypatch.setattr(lse, "scan_dir", spy)
+        (top / "a/b/new.md").write_bytes(bytes(7))
+        counter, sizes, count = list_types(str(top), True, size=True, cache=cache)
+        assert calls == [str(top / "a/b")]
+        assert counter == {**expected, ".md": 1} and count == 10
+        assert sizes == {".txt": 30, ".py": 31, NUL_KEY: 5, ".md": 7}
+
+        # counted without sizes is another kind
+        monkeypatch.undo()
+        counter, sizes, count = list_types(str(top), True, cache=cache)
+        assert counter == {**expected, ".md": 1} and not sizes
+
+
+def test_sniff(tmp_path):
+    (tmp_path / "photo").write_bytes(b"\xff\xd8\xff\xe0" + bytes(100))
+    (tmp_path / "clip.jpg").write_bytes(bytes(4) + b"ftypheic" + bytes(100))
+    (tmp_path / "run").write_bytes(b"#!/bin/sh\n")
+    (tmp_path / "notes.txt").write_bytes(b"hello")
+    (tmp_path / "empty").write_bytes(b"")
+
+    assert magic_type(str(tmp_path / "clip.jpg")) == ".heic"
+    counter, _, _ = list_types(str(tmp_path), False, sniff=True)
+    assert counter == {
+        DIR_KEY: 0,
+        ".jpg": 1,
+        ".heic": 1,
+        "#!": 1,
+        ".txt": 1,
+        NUL_KEY: 1,
+    }
+
+
+def test_run_jsonl(tmp_path, capsys):
+    make_tree(tmp_path)
+
+    lse.run(str(tmp_path), True, jsonl=True, jobs=4, size=True)
+    *dirs, summary = map(json.loads, capsys.readouterr().out.splitlines())
+    assert {d["type"] for d in dirs} == {"dir"}
+    assert len(dirs) == 5
+    by_path = {os.path.relpath(d["path"], tmp_path): d for d in dirs}
+    assert by_path["a/b"]["types"] == {DIR_KEY: 1, ".txt": 1}
+    assert by_path["a/b"]["sizes"] == {".txt": 20}
+    assert summary["type"] == "summary"
+    assert (summary["files"], summary["dirs"], summary["total"]) == (5, 4, 9)
+    assert summary["types"] == {".txt": 2, ".py": 2, NUL_KEY: 1}
+    assert summary["sizes"] == {".py": 31, ".txt": 30, NUL_KEY: 5}
+
+
+def test_cache_gitignore(tmp_path):
+    top = tmp_path / "top"
+    make_tree(top)
+    (top / ".gitignore").write_text("*.txt\n")
+
+    def types():
+        prune = Prune(str(top), gitignore=True)
+        counter, _, _ = list_types(str(top), True, prune=prune, cache=cache)
+        return counter
+
+    with DirCache(str(tmp_path / "dirs.sqlite3")) as cache:
+        assert types() == {DIR_KEY: 4, ".py": 2, NUL_KEY: 2, ".txt": 1}
+        # edited in place, no directory mtime changes
+        with open(top / ".gitignore", "a") as fp:
+            fp.write("*.py\n")
+        assert types() == {DIR_KEY: 4, NUL_KEY: 2, ".txt": 1}